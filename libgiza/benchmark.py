@@ -0,0 +1,272 @@
+"""
+Benchmarks for the content processing components of libgiza. Run all
+benchmarks with ``python -m libgiza.benchmark``, or pass the names of specific
+benchmarks as arguments.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import logging
+import os.path
+import shutil
+import tempfile
+import timeit
+
+import yaml
+
+from libgiza.config import ConfigurationBase
+from libgiza.inheritance import DataCache, InheritableContentBase
+from libgiza.template import TemplateCache
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+logger = logging.getLogger('libgiza.benchmark')
+
+
+def time_operation(operation, iterations=1):
+    """Returns the number of seconds it takes to call ``operation`` ``iterations`` times."""
+
+    start = timeit.default_timer()
+    for _ in range(iterations):
+        operation()
+
+    return timeit.default_timer() - start
+
+
+def template_sources(count):
+    return ['To run {{{{ program }}}} for example {0}, use the {{{{ command }}}} command:\n'
+            '   {{{{ program }}}} --{{{{ option }}}}'.format(idx) for idx in range(count)]
+
+
+def benchmark_templates(count=1000, iterations=10):
+    """
+    Compares rendering simple substitution templates with Jinja and with the
+    fast path. Returns a list of ``(name, seconds, unit)`` tuples.
+    """
+
+    sources = template_sources(count)
+    replacement = {'program': 'mongod', 'command': 'run', 'option': 'fork'}
+
+    results = []
+    for name, fast_path in (('jinja', False), ('fast-path', True)):
+        cache = TemplateCache(size=count, fast_path=fast_path)
+
+        def operation():
+            for source in sources:
+                cache.render(source, replacement)
+
+        results.append((name, time_operation(operation, iterations), 's'))
+
+    return results
+
+
+def measure_memory(operation):
+    """
+    Returns a tuple of the result of ``operation`` and the number of bytes
+    allocated by ``operation`` that are still in use after it returns.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        result = operation()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    return result, used
+
+
+class UnslottedContent(InheritableContentBase):
+    """
+    Content stored approximately as it was before content classes defined
+    ``__slots__`` and interned their keys: every instance has a ``__dict__``
+    that holds its attributes, and its own copy of every key. The memory
+    benchmark measures it as a baseline.
+    """
+
+    def __init__(self, src, conf):
+        super(UnslottedContent, self).__init__(src, conf)
+
+        # joining the characters creates a new string, as parsers do.
+        self._state = dict((''.join(list(key)), value) for key, value in self.state.items())
+
+        for name in ('_source_fn', '_state', '_conf'):
+            self.__dict__[name] = getattr(self, name)
+
+
+def content_documents(count):
+    template = ('ref: content-{0}\n'
+                'title:\n  text: Example {0}\n  character: "-"\n'
+                'pre: Text that introduces example {0}.\n'
+                'post: Text that follows the example.\n')
+    source = '\n---\n'.join(template.format(idx) for idx in range(count))
+
+    return list(yaml.safe_load_all(source))
+
+
+def benchmark_memory(count=10000):
+    """
+    Reports the memory used by parsed content documents, by the content units
+    created from them, and by the same units stored without ``__slots__`` and
+    interned keys (see :class:`UnslottedContent`). Returns a list of ``(name,
+    value, unit)`` tuples.
+    """
+
+    if tracemalloc is None:
+        logger.error('memory benchmarks require the tracemalloc module')
+        return []
+
+    conf = ConfigurationBase()
+
+    docs, doc_bytes = measure_memory(lambda: content_documents(count))
+    units, unit_bytes = measure_memory(lambda: [InheritableContentBase(doc, conf)
+                                                for doc in content_documents(count)])
+    del units
+    units, baseline_bytes = measure_memory(lambda: [UnslottedContent(doc, conf)
+                                                    for doc in content_documents(count)])
+
+    return [('documents', doc_bytes // count, 'bytes/unit'),
+            ('content', unit_bytes // count, 'bytes/unit'),
+            ('baseline', baseline_bytes // count, 'bytes/unit'),
+            ('reduction', 1 - float(unit_bytes) / baseline_bytes, 'fraction')]
+
+
+def write_corpus(path, files=40, depth=3, fanout=50, density=0.5):
+    """
+    Writes a synthetic corpus of ``files`` content files, with ``fanout``
+    units each, to the directory ``path``, and returns the list of file
+    names. Files form chains of ``depth + 1`` files, where every unit
+    inherits from the unit with the same position in the previous file of
+    its chain. ``density`` is the fraction of units with replacement tokens.
+    """
+
+    fns = []
+    for idx in range(files):
+        level = idx % (depth + 1)
+        fn = os.path.join(path, 'corpus-{0}.yaml'.format(idx))
+
+        docs = []
+        for unit in range(fanout):
+            doc = {'ref': 'unit-{0}-{1}'.format(idx, unit),
+                   'post': 'Text that follows unit {0} in file {1}.'.format(unit, idx)}
+
+            if level == 0:
+                doc['title'] = 'Unit {0}'.format(unit)
+                doc['replacement'] = {'program': 'program-{0}'.format(unit), 'option': 'fork'}
+            else:
+                doc['source'] = {'file': fns[-1], 'ref': 'unit-{0}-{1}'.format(idx - 1, unit)}
+
+            # spread templated units evenly through the file.
+            if int((unit + 1) * density) > int(unit * density):
+                doc['pre'] = 'Run {{program}} with --{{option}} for unit ' + str(unit) + '.'
+            else:
+                doc['pre'] = 'Text that introduces unit {0}.'.format(unit)
+
+            docs.append(doc)
+
+        with open(fn, 'w') as f:
+            yaml.safe_dump_all(docs, f, default_flow_style=False)
+
+        fns.append(fn)
+
+    return fns
+
+
+def inheritance_phases(fns):
+    """
+    Returns a list of ``(name, operation)`` tuples for the phases of
+    processing the content in ``fns``. Each operation depends on the ones
+    before it.
+    """
+
+    data = DataCache([], ConfigurationBase(), lazy=True)
+    data.ingest(fns)
+
+    # parse every file first, so that the resolve phase only measures
+    # resolution.
+    return [('ingest', lambda: data._add_files_unresolved(fns)),
+            ('resolve', data.resolve),
+            ('render', data.render_all)]
+
+
+def benchmark_inheritance(files=40, depth=3, fanout=50, density=0.5):
+    """
+    Reports the throughput of ingesting, resolving, and rendering a
+    synthetic corpus (see :func:`write_corpus()`) and, when the tracemalloc
+    module is available, the peak memory that each phase allocates. Returns
+    a list of ``(name, value, unit)`` tuples.
+    """
+
+    path = tempfile.mkdtemp()
+    try:
+        fns = write_corpus(path, files, depth, fanout, density)
+        count = files * fanout
+
+        results = []
+        for name, operation in inheritance_phases(fns):
+            results.append((name, count / time_operation(operation), 'units/s'))
+
+        if tracemalloc is not None:
+            for name, operation in inheritance_phases(fns):
+                gc.collect()
+                tracemalloc.start()
+                try:
+                    operation()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+                results.append((name + ' peak', peak / 1024.0, 'KiB'))
+    finally:
+        shutil.rmtree(path)
+
+    return results
+
+
+benchmarks = {
+    'templates': benchmark_templates,
+    'memory': benchmark_memory,
+    'inheritance': benchmark_inheritance,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run libgiza benchmarks')
+    parser.add_argument('benchmark', nargs='*',
+                        help='benchmarks to run, from: {0} (default: all)'.format(
+                            ', '.join(sorted(benchmarks))))
+    parser.add_argument('--files', type=int, default=40,
+                        help='number of files in the inheritance corpus')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='inheritance depth of the inheritance corpus')
+    parser.add_argument('--fanout', type=int, default=50,
+                        help='number of units in each file of the inheritance corpus')
+    parser.add_argument('--density', type=float, default=0.5,
+                        help='fraction of units with replacement tokens in the inheritance corpus')
+    args = parser.parse_args()
+
+    options = {
+        'inheritance': {'files': args.files, 'depth': args.depth,
+                        'fanout': args.fanout, 'density': args.density},
+    }
+
+    for name in args.benchmark:
+        if name not in benchmarks:
+            parser.error('{0} is not a valid benchmark'.format(name))
+
+    for name in args.benchmark or sorted(benchmarks):
+        print('[benchmark] {0}:'.format(name))
+        for label, value, unit in benchmarks[name](**options.get(name, {})):
+            print('    {0:>12}: {1} {2}'.format(label, round(value, 4), unit))
+
+
+if __name__ == '__main__':
+    main()
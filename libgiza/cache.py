@@ -0,0 +1,328 @@
+"""
+Provides caches that let repeated operations skip work. :class:`ParsedFileCache`
+holds data parsed from files, keyed by the file's path, size, modification
+time, and inode, so that unchanged files do not need to be parsed again.
+:class:`ContentCache` holds the results of operations, keyed by a hash of
+their input. Both caches hold values in pickled form: every read returns a new
+copy of the data, which callers are free to modify.
+"""
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+logger = logging.getLogger('libgiza.cache')
+
+if sys.version_info >= (3, 0):
+    basestring = str
+
+
+def file_signature(fn):
+    """
+    Returns a tuple of the size, modification time, and inode of a file, which
+    changes whenever the content of the file changes or the file is replaced.
+    """
+
+    stat = os.stat(fn)
+    return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+def has_json_aliases(value):
+    """
+    Returns ``True`` if ``value`` contains tuples or dicts with keys that are
+    not strings, which serialize to the same JSON as other values: ``(1, 2)``
+    as ``[1, 2]``, and ``{1: 'a'}`` as ``{'1': 'a'}``.
+    """
+
+    stack = [value]
+    while len(stack) > 0:
+        item = stack.pop()
+        if isinstance(item, tuple):
+            return True
+        elif isinstance(item, dict):
+            for key, nested in item.items():
+                if not isinstance(key, basestring):
+                    return True
+                stack.append(nested)
+        elif isinstance(item, list):
+            stack.extend(item)
+
+    return False
+
+
+def content_key(value):
+    """
+    Returns a hash of ``value``, which must be a JSON serializable structure,
+    or ``None`` if ``value`` cannot be serialized, or contains values that
+    serialize to the same JSON as values of other types (see
+    :func:`has_json_aliases()`).
+    """
+
+    if has_json_aliases(value):
+        return None
+
+    try:
+        data = json.dumps(value, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def open_temporary_file(dirname):
+    """
+    Creates a new, uniquely named file in ``dirname``, with the permissions
+    that the process umask allows, and returns a tuple of its name and an
+    open file descriptor.
+    """
+
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+
+    while True:
+        tmp_fn = os.path.join(dirname, '.tmp-' + uuid.uuid4().hex)
+        try:
+            return tmp_fn, os.open(tmp_fn, flags, 0o666)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def sync_directory(dirname):
+    """
+    Flushes the entries of the directory ``dirname`` to disk, so that renames
+    survive a crash, on platforms that support it.
+    """
+
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(fn, data):
+    """
+    Writes ``data`` (bytes) to a temporary file in the same directory as
+    ``fn`` and then renames it into place, so that concurrent readers never
+    observe a partially written file. Keeps the permissions of an existing
+    file, and writes to the target of ``fn`` if it is a symbolic link.
+    """
+
+    fn = os.path.realpath(fn)
+    tmp_fn, fd = open_temporary_file(os.path.dirname(fn))
+
+    try:
+        # the data must be on disk before the rename is, or a crash can
+        # leave an empty or partial file under the final name.
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            mode = os.stat(fn).st_mode & 0o777
+        except OSError:
+            mode = None
+
+        if mode is not None:
+            os.chmod(tmp_fn, mode)
+
+        getattr(os, 'replace', os.rename)(tmp_fn, fn)
+        sync_directory(os.path.dirname(fn))
+    except Exception:
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+        raise
+
+
+class ParsedFileCache(object):
+    """
+    Caches the result of parsing files in memory and, when ``path`` is a
+    directory name, on disk, so that other processes can reuse the results.
+    """
+
+    def __init__(self, path=None):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.path = path
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, fn):
+        return os.path.abspath(fn) in self._entries
+
+    @property
+    def path(self):
+        return self._path
+
+    @path.setter
+    def path(self, value):
+        if value is None:
+            self._path = None
+        elif isinstance(value, basestring):
+            self._path = os.path.abspath(value)
+        else:
+            raise TypeError('cache path must be a directory name, not {0}'.format(type(value)))
+
+    def _entry_fn(self, fn):
+        digest = hashlib.sha1(fn.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.pickle')
+
+    def _read_entry(self, fn, signature):
+        with self._lock:
+            if fn in self._entries and self._entries[fn][0] == signature:
+                return self._entries[fn][1]
+
+        if self.path is None:
+            return None
+
+        entry_fn = self._entry_fn(fn)
+        if not os.path.isfile(entry_fn):
+            return None
+
+        try:
+            with open(entry_fn, 'rb') as f:
+                entry_source, entry_signature, payload = pickle.load(f)
+        except Exception as e:
+            logger.warning('ignoring invalid cache entry {0} ({1})'.format(entry_fn, e))
+            return None
+
+        if entry_source != fn or entry_signature != signature:
+            return None
+
+        with self._lock:
+            self._entries[fn] = (signature, payload)
+
+        return payload
+
+    def _write_entry(self, fn, signature, payload):
+        with self._lock:
+            self._entries[fn] = (signature, payload)
+
+        if self.path is None:
+            return
+
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+
+            atomic_write(self._entry_fn(fn),
+                         pickle.dumps((fn, signature, payload), pickle.HIGHEST_PROTOCOL))
+        except (IOError, OSError) as e:
+            logger.warning('could not write cache entry for {0} ({1})'.format(fn, e))
+
+    def load(self, fn, parser):
+        """
+        Returns the parsed content of ``fn``. When there is no entry for the
+        current version of the file, calls ``parser`` with the file name and
+        caches the result.
+        """
+
+        fn = os.path.abspath(fn)
+        signature = file_signature(fn)
+
+        payload = self._read_entry(fn, signature)
+        if payload is not None:
+            logger.debug('using cached content for {0}'.format(fn))
+            return pickle.loads(payload)
+
+        data = parser(fn)
+        self._write_entry(fn, signature, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+        return data
+
+    def discard(self, fn):
+        """Removes the in-memory entry for ``fn``, if present."""
+
+        with self._lock:
+            self._entries.pop(os.path.abspath(fn), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+class ContentCache(object):
+    """
+    Caches values by content key (see :func:`content_key()`) in memory and,
+    when ``path`` is a directory name, on disk.
+    """
+
+    def __init__(self, path=None):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.path = path
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    path = ParsedFileCache.path
+
+    def _entry_fn(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+    def get(self, key):
+        """Returns the value stored for ``key``, or ``None``."""
+
+        with self._lock:
+            payload = self._entries.get(key)
+
+        if payload is None and self.path is not None:
+            try:
+                with open(self._entry_fn(key), 'rb') as f:
+                    payload = f.read()
+            except (IOError, OSError):
+                return None
+
+            with self._lock:
+                self._entries[key] = payload
+
+        if payload is None:
+            return None
+
+        try:
+            return pickle.loads(payload)
+        except Exception as e:
+            logger.warning('ignoring invalid cache entry {0} ({1})'.format(key, e))
+            return None
+
+    def set(self, key, value):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        with self._lock:
+            self._entries[key] = payload
+
+        if self.path is None:
+            return
+
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+
+            atomic_write(self._entry_fn(key), payload)
+        except (IOError, OSError) as e:
+            logger.warning('could not write cache entry {0} ({1})'.format(key, e))
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
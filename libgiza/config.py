@@ -16,15 +16,136 @@ import logging
 import os.path
 import json
 import contextlib
+import copy
 import sys
 import numbers
+import uuid
 
+import future.utils
 import yaml
 
+from libgiza.cache import ParsedFileCache, atomic_write
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 logger = logging.getLogger('libgiza.config')
 
 if sys.version_info >= (3, 0):
     basestring = str
+    intern = sys.intern
+
+# the types of string and number values: in Python 2 these include unicode
+# and long, which sys.maxsize + 1 is.
+_plain_types = frozenset([str, type(u''), int, type(sys.maxsize + 1), float, bool])
+
+# marks the end of the values of an object in the serialize() stack.
+_finished = object()
+
+
+def intern_key(key):
+    """
+    Returns an interned copy of the string ``key`` so that all configuration
+    objects with the same keys share one copy of each key.
+    """
+
+    try:
+        return intern(key)
+    except TypeError:
+        return key
+
+
+# the content of the files that configuration objects load, which every
+# object in the process shares. Set ``parsed_files.path`` to a directory to
+# also share the parsed content between processes.
+parsed_files = ParsedFileCache()
+
+
+def load_data_file(fn):
+    """Returns the parsed content of the JSON or YAML file ``fn``."""
+
+    with open(fn, 'r') as f:
+        if fn.endswith('json'):
+            return json.load(f)
+        else:
+            return yaml.safe_load(f)
+
+
+# configuration objects that pickle as a reference, by token, and the number
+# of times each is shared. See share_configuration().
+_shared_configurations = {}
+_share_counts = {}
+
+
+def share_configuration(conf):
+    """
+    Registers ``conf`` so that, until :func:`unshare_configuration()`,
+    pickles of ``conf`` only hold a reference to it. Returns a ``(token,
+    payload)`` tuple: pass both to :func:`install_shared_configuration()` in
+    another process to unpickle references there. Sharing an object that is
+    already shared returns the same token, and the object remains shared
+    until every share is undone.
+    """
+
+    token = conf.__dict__.get('_share_token')
+    if token in _shared_configurations:
+        _share_counts[token] += 1
+        return token, _shared_configurations[token][1]
+
+    payload = pickle.dumps(conf, pickle.HIGHEST_PROTOCOL)
+    token = uuid.uuid4().hex
+
+    conf._share_token = token
+    _shared_configurations[token] = (conf, payload)
+    _share_counts[token] = 1
+
+    return token, payload
+
+
+def unshare_configuration(conf):
+    token = conf.__dict__.get('_share_token')
+    if token not in _share_counts:
+        return
+
+    _share_counts[token] -= 1
+    if _share_counts[token] == 0:
+        del _share_counts[token]
+        del _shared_configurations[token]
+        del conf.__dict__['_share_token']
+
+
+def install_shared_configuration(token, payload):
+    """
+    Registers the configuration object in ``payload`` under ``token``, as
+    returned by :func:`share_configuration()`. Used as the initializer of
+    worker processes.
+    """
+
+    conf = pickle.loads(payload)
+    conf._share_token = token
+    _shared_configurations[token] = (conf, payload)
+    _share_counts[token] = 1
+
+
+def shared_configuration(token):
+    try:
+        return _shared_configurations[token][0]
+    except KeyError:
+        m = 'shared configuration {0} is not installed in this process'.format(token)
+        logger.error(m)
+        raise ConfigurationError(m)
+
+
+class UnaliasedDumper(yaml.SafeDumper):
+    """
+    Writes values that appear in several places in full each time, rather
+    than as YAML aliases, since :func:`serialize()` output can share values.
+    """
+
+    def ignore_aliases(self, data):
+        return True
 
 
 class ConfigurationError(Exception):
@@ -35,8 +156,140 @@ class OutputError(Exception):
     pass
 
 
-class ConfigurationBase(object):
+class LazySection(object):
+    """
+    Descriptor for a nested configuration section that holds an instance of
+    ``section_class``. Setting the attribute stores the raw value (e.g. a
+    dict) in the object's state, and the section object is only constructed
+    when the attribute is first read.
+
+    Subsections of :class:`RecursiveConfigurationBase` objects share the
+    ``conf`` of their parent; subsections of other objects use the parent
+    itself as their ``conf``.
+    """
+
+    def __init__(self, section_class, name=None):
+        self.section_class = section_class
+        self.name = name
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+
+        try:
+            value = obj.state[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+        if not isinstance(value, self.section_class):
+            if issubclass(self.section_class, RecursiveConfigurationBase):
+                conf = obj.conf if isinstance(obj, RecursiveConfigurationBase) else obj
+                value = self.section_class(value, conf)
+            else:
+                value = self.section_class(value)
+
+            obj.state[self.name] = value
+
+        return value
+
+    def __set__(self, obj, value):
+        if isinstance(value, (dict, basestring, self.section_class)):
+            obj.state[self.name] = value
+        else:
+            m = 'cannot set {0} section to {1} value'.format(self.name, type(value))
+            logger.error(m)
+            raise TypeError(m)
+
+
+class CachedProperty(object):
+    """
+    Descriptor for a read-only property of a configuration object that is
+    computed once and then stored in the instance. Setting the property
+    raises :exc:`AttributeError`. The stored value is
+    discarded when any of the keys in ``depends`` are set with setattr or
+    :meth:`ConfigurationBase.ingest()`, or, if ``depends`` is ``None``, when
+    any key is set. Values written directly to ``state`` do not discard
+    stored values. Use :func:`cached_property()` to create these properties.
+    """
+
+    def __init__(self, getter, depends=None):
+        self.getter = getter
+        self.name = getter.__name__
+        self.depends = None if depends is None else frozenset(depends)
+        self.__doc__ = getter.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+
+        # stored values are found in the instance before this non-data
+        # descriptor, so this only runs when there is no stored value.
+        value = self.getter(obj)
+        obj.__dict__[self.name] = value
+        return value
+
+
+def cached_property(getter=None, depends=None):
+    """
+    Decorator that creates a :class:`CachedProperty`. Use either as
+    ``@cached_property`` or as ``@cached_property(depends=['key'])``.
+    """
+
+    if getter is None:
+        return lambda getter: CachedProperty(getter, depends)
+    else:
+        return CachedProperty(getter, depends)
+
+
+class ConfigurationMeta(type):
+    """
+    Metaclass for configuration objects that computes, once per class, the
+    sets of names that attribute access checks. Attribute access falls back
+    to the registry and ``dir()`` for names added after the class is created.
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super(ConfigurationMeta, cls).__init__(name, bases, namespace)
+
+        for key, value in namespace.items():
+            if isinstance(value, LazySection) and value.name is None:
+                value.name = key
+
+        cls._lazy_sections = frozenset(key for base in cls.__mro__
+                                       for key, value in vars(base).items()
+                                       if isinstance(value, LazySection))
+
+        cached = {}
+        for base in reversed(cls.__mro__):
+            for key, value in vars(base).items():
+                if isinstance(value, CachedProperty):
+                    cached[key] = value
+                else:
+                    cached.pop(key, None)
+
+        cls._cached_properties = frozenset(cached)
+        cls._cache_discard_always = frozenset(name for name, prop in cached.items()
+                                              if prop.depends is None)
+        cls._cache_dependents = {}
+        for name, prop in cached.items():
+            for key in prop.depends or ():
+                cls._cache_dependents.setdefault(key, set()).add(name)
+        cls._registry_keys = frozenset(cls._option_registry)
+        cls._redacted = frozenset(cls._redacted_keys)
+        cls._dict_owner = next(base for base in cls.__mro__ if 'dict' in vars(base))
+        cls._class_attributes = frozenset(dir(cls))
+        cls._ingest_rank = dict((key, idx) for idx, key in enumerate(cls._ingest_order))
+        cls._setattr_owner = next(base for base in cls.__mro__ if '__setattr__' in vars(base))
+
+
+class ConfigurationBase(future.utils.with_metaclass(ConfigurationMeta, object)):
+    # instances keep their attributes in slots rather than in a per-instance
+    # __dict__, which is only created for other attributes. Subclasses that
+    # have many instances should also define __slots__.
+    __slots__ = ('_source_fn', '_state', '__dict__', '__weakref__')
+
     _option_registry = []
+    _ingest_order = []
     _redacted_keys = ['pass', 'password', 'token', 'key', 'secret']
     _version = 0
 
@@ -50,13 +303,49 @@ class ConfigurationBase(object):
             return
 
         input_obj = self._prep_load_data(input_obj)
+        cls = type(self)
+
+        # registry values go directly into the state, unless a subclass
+        # overrides __setattr__; all other keys use setattr.
+        if cls._setattr_owner is ConfigurationBase:
+            registry = cls._registry_keys
+        else:
+            registry = frozenset()
+
+        state = self.state
+        values = []
+        items = []
+        for key, value in input_obj.items():
+            key = intern_key(key)
+            if key in registry:
+                values.append((key, value))
+            else:
+                items.append((key, value))
+
+        if len(items) == 0:
+            state.update(values)
+        else:
+            # setters can read and override registry values, so registry
+            # values are written in order with the other keys.
+            items.extend(values)
 
         # We need deterministic iteration order---"paths" must come before
-        # "git", or else we have an uninitialized read from Configuration.paths
-        items = list(input_obj.items())
-        items.sort(reverse=True)
+        # "git", or else we have an uninitialized read from Configuration.paths.
+        # Keys in _ingest_order come first, and then the rest in reverse order.
+        if len(items) > 1:
+            # keys are unique, so sorting never compares values.
+            items.sort(reverse=True)
+
+            rank = cls._ingest_rank
+            if len(rank) > 0:
+                # sorting is stable, so unranked keys stay in reverse order.
+                items.sort(key=lambda item: rank.get(item[0], len(rank)))
 
         for key, value in items:
+            if key in registry:
+                state[key] = value
+                continue
+
             try:
                 setattr(self, key, value)
             except AttributeError as e:
@@ -65,19 +354,35 @@ class ConfigurationBase(object):
                 logger.error(m)
                 raise ConfigurationError(m)
 
+        if cls._cache_discard_always or cls._cache_dependents:
+            for key in input_obj:
+                if not key.startswith('_'):
+                    self._discard_cached(key)
+
+    def _discard_cached(self, key):
+        """Discards the stored values of cached properties that depend on ``key``."""
+
+        cls = type(self)
+        values = self.__dict__
+
+        for name in cls._cache_discard_always:
+            if name != key:
+                values.pop(name, None)
+
+        for name in cls._cache_dependents.get(key, ()):
+            values.pop(name, None)
+
     def _prep_load_data(self, input_obj):
         if isinstance(input_obj, dict):
             return input_obj
         elif not isinstance(input_obj, ConfigurationBase) and os.path.isfile(input_obj):
             self._source_fn = input_obj
 
-            with open(input_obj, 'r') as f:
-                if input_obj.endswith('json'):
-                    input_obj = json.load(f)
-                elif input_obj.endswith('yaml') or input_obj.endswith('yml'):
-                    input_obj = yaml.safe_load(f)
-                else:
-                    logger.error("file {0} has unknown data format".format(input_obj))
+            # the cache returns a new copy of the content for every object.
+            if input_obj.endswith(('json', 'yaml', 'yml')):
+                input_obj = parsed_files.load(input_obj, load_data_file)
+            else:
+                logger.error("file {0} has unknown data format".format(input_obj))
 
             if input_obj is None:
                 input_obj = {}
@@ -88,6 +393,50 @@ class ConfigurationBase(object):
 
         return input_obj
 
+    def __reduce_ex__(self, protocol):
+        # most objects have no __dict__, and reading it would create one.
+        if len(_shared_configurations) > 0:
+            token = self.__dict__.get('_share_token')
+            if token is not None and token in _shared_configurations:
+                return (shared_configuration, (token,))
+
+        return super(ConfigurationBase, self).__reduce_ex__(protocol)
+
+    def __copy__(self):
+        return self._copy(None)
+
+    def __deepcopy__(self, memo):
+        return self._copy(memo)
+
+    def _copy(self, memo):
+        # copies the object as the copy module would, because __reduce_ex__
+        # only returns a reference to shared objects. Copies are not shared.
+        func, args, state = object.__reduce_ex__(self, 2)[:3]
+        result = func(*args)
+        if memo is not None:
+            memo[id(self)] = result
+
+        if state is None:
+            return result
+        elif memo is not None:
+            state = copy.deepcopy(state, memo)
+
+        setstate = getattr(type(result), '__setstate__', None)
+        if setstate is not None:
+            setstate(result, state)
+            return result
+        elif isinstance(state, tuple):
+            state, slots = state
+        else:
+            slots = None
+
+        for values in (state, slots):
+            for key, value in (values or {}).items():
+                if key != '_share_token':
+                    object.__setattr__(result, key, value)
+
+        return result
+
     def __contains__(self, key):
         if key in self.state:
             return True
@@ -97,30 +446,46 @@ class ConfigurationBase(object):
             return False
 
     def __getattr__(self, key):
-        try:
-            return object.__getattribute__(self, key)
-        except AttributeError as e:
-            m = 'key "{0}" in configuration object ({1}) is not defined'.format(key, type(self))
-            if key in self._option_registry:
-                try:
-                    return self.state[key]
-                except KeyError:
-                    raise AttributeError(m, e.message)
-            else:
-                if not key.startswith('_'):
-                    logger.debug(m)
-                raise AttributeError(m, e.message)
+        # only called after normal attribute lookup fails.
+        m = 'key "{0}" in configuration object ({1}) is not defined'.format(key, type(self))
+
+        if key in type(self)._registry_keys or key in self._option_registry:
+            try:
+                return self.state[key]
+            except KeyError:
+                raise AttributeError(m)
+        else:
+            if not key.startswith('_'):
+                logger.debug(m)
+            raise AttributeError(m)
 
     def __setattr__(self, key, value):
-        if key in self._option_registry:
+        cls = type(self)
+
+        if key in cls._registry_keys:
+            self.state[key] = value
+        elif key.startswith('_'):
+            # internal attributes do not affect cached properties.
+            object.__setattr__(self, key, value)
+            return
+        elif key in cls._cached_properties:
+            m = 'cannot set "{0}", which is a cached property of {1}'.format(key, cls)
+            logger.error(m)
+            raise AttributeError(m)
+        elif key in cls._class_attributes:
+            object.__setattr__(self, key, value)
+        elif key in self._option_registry:
             self.state[key] = value
-        elif key.startswith('_') or key in dir(self):
+        elif key in dir(self):
             object.__setattr__(self, key, value)
         else:
             msg = 'configuration object {0} lacks support for "{1}" value'.format(type(self), key)
             logger.error(msg)
             raise TypeError(msg)
 
+        if cls._cache_discard_always or cls._cache_dependents:
+            self._discard_cached(key)
+
     @property
     def state(self):
         return self._state
@@ -139,40 +504,25 @@ class ConfigurationBase(object):
             return False
 
     def __repr__(self):
-        return str(self.dict())
+        # only lists the keys: objects appear in log messages, and
+        # serializing them for every message is expensive.
+        return '<{0}: {1}>'.format(type(self).__name__,
+                                   ', '.join(str(key) for key in self.state))
 
     def __get_dict_value__(self, v, safe=True):
-        if isinstance(v, ConfigurationBase):
-            return v.dict(safe)
-        elif isinstance(v, list) and len(v) > 0 and isinstance(v[0], ConfigurationBase):
-            return [i.dict() for i in v]
-        elif isinstance(v, dict):
-            sub_d = {}
-            for key, value, in v.items():
-                sub_d[key] = self.__get_dict_value__(value)
-            return sub_d
-        elif self._is_value_type(v):
-            return v
-        else:
-            return 'error'
+        return serialize(v, safe)
 
     def dict(self, safe=True):
-        d = {}
-
-        for key, value in self.state.items():
-            if safe in (True, None):
-                if key != "_id" and key.startswith('_'):
-                    continue
-                elif key in self._redacted_keys:
-                    d[key] = 'redacted'
-                else:
-                    d[key] = self.__get_dict_value__(value, safe)
-            elif safe is False:
-                d[key] = self.__get_dict_value__(value, safe)
+        return serialize(self, safe, dispatch=False)
 
-        return d
+    def write(self, fn=None, add_version=False, compact=False):
+        """
+        Writes the object to ``fn``, or to the file it was read from, in the
+        format that the file's extension specifies. If ``compact`` is
+        ``True``, JSON output has no whitespace. Replaces the file
+        atomically, so readers never see a partially written file.
+        """
 
-    def write(self, fn=None, add_version=False):
         if fn is None:
             if self._source_fn is None:
                 logger.error('cannot write object to unspecified file.')
@@ -186,21 +536,39 @@ class ConfigurationBase(object):
         if add_version is True and 'v' not in self.state:
             self.state['v'] = self._version
 
+        atomic_write(fn, self._file_content(fn, compact))
+
+    def _file_content(self, fn, compact=False):
+        """Returns the bytes that :meth:`write()` writes to ``fn``."""
+
         if fn.endswith('json'):
-            with open(fn, 'w') as f:
-                json.dump(self.dict(safe=False), f, indent=3, sort_keys=True)
+            if compact is True:
+                content = json.dumps(self.dict(safe=False), sort_keys=True,
+                                     separators=(',', ':'))
+            else:
+                content = json.dumps(self.dict(safe=False), indent=3, sort_keys=True)
         elif fn.endswith('yaml') or fn.endswith('yml'):
-            with open(fn, 'w') as f:
-                yaml.safe_dump(self.dict(safe=False), f, default_flow_style=False)
+            content = yaml.dump(self.dict(safe=False), Dumper=UnaliasedDumper,
+                                default_flow_style=False)
         else:
             raise OutputError("unsupported file format: {0}".format(fn))
 
+        if isinstance(content, bytes):
+            return content
+        else:
+            return content.encode('utf-8')
+
     @classmethod
     @contextlib.contextmanager
-    def persisting(cls, fn, override=False):
+    def persisting(cls, fn, override=False, compact=False):
+        """
+        Context manager that yields an object with the content of ``fn``,
+        and writes the object back to ``fn`` on exit if its content changed.
+        Creates ``fn`` if it does not exist.
+        """
+
         if not os.path.isfile(fn):
-            with open(fn, 'w') as f:
-                json.dump({}, f, indent=3)
+            atomic_write(fn, b'{}')
 
         if override is False:
             data = cls(fn)
@@ -209,12 +577,111 @@ class ConfigurationBase(object):
             input_data = data._prep_load_data(fn)
             data.state.update(input_data)
 
+        original = data._file_content(fn, compact)
+
         yield data
 
-        data.write(fn)
+        if data._file_content(fn, compact) != original:
+            data.write(fn, compact=compact)
+        else:
+            logger.debug('{0} is unchanged, not writing file'.format(fn))
+
+
+def serialize(value, safe=True, dispatch=True):
+    """
+    Returns the dicts, lists, and values that represent ``value``, which is
+    usually a configuration object, as :meth:`ConfigurationBase.dict()`
+    does. When ``safe`` is ``True`` or ``None``, omits internal keys and
+    redacts secret values. Configuration objects with a custom ``dict()``
+    method use it, unless ``dispatch`` is ``False`` and ``value`` is the
+    object.
+
+    Traverses the structure without recursion, and represents an object that
+    contains itself with the string ``'cycle'``. An object that the structure
+    refers to in several places serializes separately for each reference, so
+    that changing one part of the output never changes another.
+    """
+
+    root = [None]
+    active = set()
+    stack = [(value, safe, False, root, 0)]
+
+    while len(stack) > 0:
+        value, safe, in_list, target, key = stack.pop()
+
+        if value is _finished:
+            # all values in the object with the id ``key`` are serialized.
+            active.discard(key)
+            continue
+
+        is_config = isinstance(value, ConfigurationBase)
+
+        if (is_config and value._dict_owner is not ConfigurationBase and
+                (dispatch is True or target is not root)):
+            target[key] = value.dict() if in_list else value.dict(safe)
+        elif is_config or isinstance(value, dict):
+            node = id(value)
+            if node in active:
+                target[key] = 'cycle'
+                continue
+
+            output = {}
+            target[key] = output
+
+            if is_config is False:
+                # values in dicts always serialize in safe mode.
+                items = value.items()
+                safe = True
+            else:
+                for name in value._lazy_sections:
+                    if name in value.state:
+                        getattr(value, name)
+
+                if safe in (True, None):
+                    redacted = value._redacted
+                    items = []
+                    for name, item in value.state.items():
+                        if name != '_id' and name.startswith('_'):
+                            continue
+                        elif name in redacted:
+                            output[name] = 'redacted'
+                        else:
+                            output[name] = None
+                            items.append((name, item))
+                elif safe is False:
+                    items = value.state.items()
+                else:
+                    items = ()
+
+            mark = len(stack)
+            for name, item in items:
+                # strings and numbers are the most common values: copy them
+                # directly, rather than through the stack.
+                if type(item) in _plain_types:
+                    output[name] = item
+                else:
+                    output[name] = None
+                    stack.append((item, safe, False, output, name))
+
+            if len(stack) > mark:
+                active.add(node)
+                stack.insert(mark, (_finished, None, None, output, node))
+        elif isinstance(value, list) and len(value) > 0 and isinstance(value[0], ConfigurationBase):
+            output = [None] * len(value)
+            target[key] = output
+            for idx, item in enumerate(value):
+                stack.append((item, True, True, output, idx))
+        elif ConfigurationBase._is_value_type(value):
+            target[key] = value
+        else:
+            target[key] = 'error'
+
+    return root[0]
 
 
 class RecursiveConfigurationBase(ConfigurationBase):
+    __slots__ = ('_conf',)
+
     def __init__(self, obj, conf):
         self._conf = None
         self.conf = conf
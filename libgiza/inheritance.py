@@ -26,10 +26,14 @@ import logging
 import os.path
 import sys
 
-import jinja2
 import yaml
 
+import libgiza
+from libgiza.cache import ParsedFileCache, content_key
 from libgiza.config import RecursiveConfigurationBase, ConfigurationBase
+from libgiza.task import Task
+from libgiza.template import (render_template, resolve_replacements, has_template_syntax,
+                              TemplateError)
 
 logger = logging.getLogger('libgiza.inheritance')
 
@@ -46,6 +50,20 @@ class InheritableContentError(Exception):
     pass
 
 
+def iter_yaml_documents(fn):
+    """Generator of the documents in the YAML file ``fn``, parsed one at a time."""
+
+    with open(fn, 'r') as f:
+        for doc in yaml.safe_load_all(f):
+            yield doc
+
+
+def load_yaml_documents(fn):
+    """Returns a list of all documents in the YAML file ``fn``."""
+
+    return list(iter_yaml_documents(fn))
+
+
 class InheritanceReference(RecursiveConfigurationBase):
     """
     Represents a single reference to another unit of content. The
@@ -53,6 +71,8 @@ class InheritanceReference(RecursiveConfigurationBase):
     attribute, returns an error if it cannot discover a specified value.
     """
 
+    __slots__ = ()
+
     _option_registry = ['ref']
 
     @property
@@ -106,6 +126,8 @@ class InheritableContentBase(RecursiveConfigurationBase):
     sub-classed.
     """
 
+    __slots__ = ()
+
     _option_registry = ['pre', 'post', 'final', 'ref', 'content', 'edition']
     _reference_type = InheritanceReference
 
@@ -181,14 +203,9 @@ class InheritableContentBase(RecursiveConfigurationBase):
 
     def _is_resolveable(self, data):
         try:
-            if self.source.file in data.cache:
-                return True
-            else:
-                for key in data.cache.keys():
-                    if key.endswith(self.source.file):
-                        return True
-
-                return False
+            # source files are often relative names, which the data cache
+            # maps to cached files once.
+            return data._cached_file_name(self.source.file) is not None
         except AttributeError:
             logger.warning(str(data) + ' is not resolvable')
             return False
@@ -205,8 +222,17 @@ class InheritableContentBase(RecursiveConfigurationBase):
 
         if self._is_resolveable(data):
             try:
-                base = copy.deepcopy(data.fetch(self.source.file, self.source.ref))
-                base.resolve(data)
+                parent = data.fetch(self.source.file, self.source.ref)
+                if not parent.is_resolved():
+                    parent.resolve(data)
+
+                # copy the parent content, but not its configuration object.
+                memo = {}
+                conf = getattr(parent, 'conf', None)
+                if conf is not None:
+                    memo[id(conf)] = conf
+
+                base = copy.deepcopy(parent, memo)
 
                 needs_replacement = self.replacement != base.replacement
 
@@ -232,55 +258,144 @@ class InheritableContentBase(RecursiveConfigurationBase):
             logger.error(m)
             raise InheritableContentError(m)
 
-    def render(self):
-        if self.replacement:
-            attempts = range(10)
-
-            for key in self.state.keys():
-                if isinstance(self.state[key], collections.Iterable):
-                    should_resplit = None
-
-                    # code blocks are stored internally as lists to preserve
-                    # formatting, so to preserve formatting and compatibility
-                    # with existing examples, we join them up, do the formatting
-                    # and then split it back up.
-                    if isinstance(self.state[key], list):
-                        for it in self.state[key]:
-                            if not isinstance(it, basestring):
-                                should_resplit = False
-                                break
-
-                        # do the splitting, but if any of the elements weren't
-                        # strings then we can't render the string, so it makes
-                        # sense to go on to the next key in the dict.
-                        if should_resplit is None:
-                            should_resplit = True
-                            self.state[key] = '\n'.join(self.state[key])
-                        elif should_resplit is False:
-                            continue
-
-                    # we do this in a loop to in case there are replacements in
-                    # replacements. 10 seems like a good number.
-                    for i in attempts:
-                        if '{{' not in self.state[key]:
-                            break
-
-                        template = jinja2.Template(self.state[key])
-                        self.state[key] = template.render(**self.replacement)
-                        if '{{' not in self.state[key]:
-                            break
-
-                    if should_resplit is True:
-                        self.state[key] = self.state[key].split('\n')
-                elif isinstance(self.state[key], InheritableContentBase):
-                    if len(self.state[key].replacement) == 0:
-                        self.state[key].replacement = self.replacement
-
-                    self.state[key].render()
-
-                if isinstance(self.state[key], basestring) and "{{" in self.state[key]:
-                    logger.error("unable to resolve all tokens in content"
-                                 " '{0}' key '{1}'.".format(self.ref, key))
+    def render(self, cache=None):
+        """
+        Renders all tokens in the content. If ``cache`` is a
+        :class:`~libgiza.cache.ContentCache`, reuses the rendered fields from
+        earlier renderings of content with the same fields and replacement
+        values, and stores new results in the cache.
+        """
+
+        if not self.replacement:
+            return
+
+        if cache is not None:
+            payload = self.render_payload()
+            if payload is not None:
+                fields, replacement = payload
+                if len(fields) > 0:
+                    key = render_key(fields, replacement)
+                    rendered = None if key is None else cache.get(key)
+                    if rendered is None:
+                        rendered = render_chunk([(self.ref, fields, replacement)])[0][1]
+                        if key is not None:
+                            cache.set(key, rendered)
+
+                    self.update_rendered(rendered)
+                return
+
+        # replacement values can contain tokens themselves: resolve them first,
+        # so that every field renders in a single pass.
+        try:
+            replacement = resolve_replacements(self.replacement)
+        except TemplateError as e:
+            m = 'cannot render content "{0}": {1}'.format(self.state.get('ref'), e)
+            logger.error(m)
+            raise InheritableContentError(m)
+
+        rendered = {}
+        for key, value in self.state.items():
+            if isinstance(value, InheritableContentBase):
+                if len(value.replacement) == 0:
+                    value.replacement = self.replacement
+
+                value.render()
+            else:
+                rendered[key] = render_value(value, replacement)
+
+        self.update_rendered(rendered)
+
+    def render_payload(self):
+        """
+        Returns a ``(fields, replacement)`` tuple that holds the fields that
+        contain tokens, for rendering with :func:`render_chunk()`. Returns
+        ``None`` if the content holds nested content units, which must render
+        with :meth:`render()`.
+        """
+
+        fields = {}
+        if not self.replacement:
+            return fields, {}
+
+        for key, value in self.state.items():
+            if isinstance(value, InheritableContentBase):
+                return None
+            elif has_template_syntax(value):
+                fields[key] = value
+            elif isinstance(value, list):
+                for item in value:
+                    if has_template_syntax(item):
+                        fields[key] = value
+                        break
+
+        return fields, dict(self.replacement)
+
+    def update_rendered(self, fields):
+        for key, value in fields.items():
+            self.state[key] = value
+
+            if has_template_syntax(value):
+                logger.error("unable to resolve all tokens in content"
+                             " '{0}' key '{1}'.".format(self.ref, key))
+
+
+def render_key(fields, replacement):
+    """
+    Returns the cache key for the output of rendering ``fields`` with
+    ``replacement``, or ``None`` if the values are not serializable. The key
+    includes the library version, so that upgrades invalidate cached output.
+    """
+
+    return content_key([libgiza.__version__, fields, replacement])
+
+
+def render_chunk(chunk):
+    """
+    Renders a list of ``(key, fields, replacement)`` tuples, where ``key``
+    identifies the content in its file and the fields and replacement are as
+    returned by :meth:`InheritableContentBase.render_payload()`, and returns a
+    list of ``(key, rendered_fields)`` tuples. Runs in worker processes for
+    :meth:`DataCache.render_all()`.
+    """
+
+    results = []
+    for key, fields, replacement in chunk:
+        try:
+            replacement = resolve_replacements(replacement)
+        except TemplateError as e:
+            raise InheritableContentError('cannot render content "{0}": {1}'.format(key, e))
+
+        results.append((key, dict((name, render_value(value, replacement))
+                                  for name, value in fields.items())))
+
+    return results
+
+
+def render_value(value, replacement):
+    """
+    Returns ``value`` with all tokens rendered using the ``replacement``
+    mapping, which should already be resolved. Renders strings and lists of
+    strings, and returns all other values unchanged.
+    """
+
+    if isinstance(value, basestring):
+        if '{{' in value:
+            return render_template(value, replacement)
+    elif isinstance(value, list) and len(value) > 0:
+        # code blocks are stored internally as lists to preserve formatting,
+        # so to preserve formatting and compatibility with existing examples,
+        # we join them up, do the formatting and then split it back up.
+        has_tokens = False
+        for item in value:
+            if not isinstance(item, basestring):
+                return value
+            elif '{{' in item:
+                has_tokens = True
+
+        if has_tokens:
+            return render_template('\n'.join(value), replacement).split('\n')
+
+    return value
 
 
 class DataContentBase(RecursiveConfigurationBase):
@@ -331,9 +446,18 @@ class DataContentBase(RecursiveConfigurationBase):
             logger.warning('cannot use invalid data cache instance.')
 
     def ingest(self, src):
-        if not isinstance(src, list) and os.path.isfile(src):
-            with open(src, 'r') as f:
-                src = [doc for doc in yaml.safe_load_all(f)]
+        for content in self.ingest_iter(src):
+            pass
+
+    def ingest_iter(self, src):
+        """
+        Generator that adds the documents in ``src``, which is a file name or
+        an iterable of documents, and yields each content unit after adding
+        it. Processes each document as the iterable produces it.
+        """
+
+        if isinstance(src, basestring) and os.path.isfile(src):
+            src = iter_yaml_documents(src)
 
         for doc in src:
             if doc is None:
@@ -346,12 +470,14 @@ class DataContentBase(RecursiveConfigurationBase):
                 self._ordering.append(content.ref)
                 self._reordered = False
             except RuntimeError:
-                pass
+                continue
             except Exception as e:
                 logger.error('could not inherit, because: ' + str(e))
                 logger.info(doc)
                 raise e
 
+            yield content
+
     def add(self, doc):
         if 'ref' in doc:
             ref = doc['ref']
@@ -370,6 +496,7 @@ class DataContentBase(RecursiveConfigurationBase):
             if isinstance(doc, self.content_class):
                 content = doc
             else:
+                doc = self.data.share_values(doc)
                 try:
                     content = self.content_class(doc)
                 except TypeError:
@@ -380,7 +507,7 @@ class DataContentBase(RecursiveConfigurationBase):
 
             self.content[content.ref] = content
 
-            if not content.is_resolved():
+            if not content.is_resolved() and not self.data.resolution_deferred:
                 content.resolve(self.data)
 
             return content
@@ -395,7 +522,7 @@ class DataContentBase(RecursiveConfigurationBase):
             content = self.content[ref]
 
             if not content.is_resolved():
-                content.resolve(self)
+                content.resolve(self.data)
 
             return content
         else:
@@ -422,23 +549,24 @@ class DataContentBase(RecursiveConfigurationBase):
         """
         Generator of content items in order. If items have a ``number`` member,
         then we sort in this order. Otherwise, we return in the order that they
-        were specified in the file.
+        were specified in the file. The order is computed once, and again only
+        after adding content.
         """
-        def sorter(ref_a, ref_b):
-            # would be cmp() in python 2, but this is py3 compatible
-            a_num = self.fetch(ref_a).number
-            b_num = self.fetch(ref_b).number
-
-            return (a_num > b_num) - (a_num < b_num)
 
         if self._reordered is False:
-            for content in self.content.values():
+            numbers = {}
+            for ref in self._ordering:
+                content = self.fetch(ref)
                 if 'number' not in content:
-                    self._reordered = True
+                    numbers = None
                     break
 
-        if self._reordered is False:
-            self._ordering.sort(cmp=sorter)
+                numbers[ref] = content.number
+
+            # sort is stable, so items with the same number stay in file order.
+            if numbers is not None:
+                self._ordering.sort(key=numbers.__getitem__)
+
             self._reordered = True
 
         for ref in self._ordering:
@@ -449,14 +577,41 @@ class DataCache(RecursiveConfigurationBase):
     """
     Represents a group of related files that hold similar kinds of structured
     data. Often subclassed.
+
+    If ``cache_dir`` is specified, the parsed content of every file is stored
+    in that directory, and later instances only reparse files that have
+    changed since the cache entry was written.
+
+    If ``lazy`` is ``True``, the constructor only records the names of the
+    files, and each file is parsed and resolved when first fetched or
+    iterated.
+
+    The cache indexes content by the fields in ``indexed_fields``, the name
+    of the file that holds the content (``file``) and the name of the file
+    that the content inherits from (``source``), so that :meth:`query()`
+    can find content without scanning every unit.
     """
 
     content_class = DataContentBase
     content_type = None
+    indexed_fields = ('ref', 'edition')
 
-    def __init__(self, files, conf):
+    def __init__(self, files, conf, cache_dir=None, lazy=False):
         self._cache = {}
+        self._dependents = {}
+        self._file_names = {}
+        self._shared_values = {}
+        self._indexes = dict((field, {}) for field in self.index_names)
+        self._indexed_files = {}
         self._conf = conf
+        self._resolution_deferred = False
+        self.lazy = lazy
+
+        if cache_dir is None:
+            self._parsed_files = None
+        else:
+            self._parsed_files = ParsedFileCache(cache_dir)
+
         self.ingest(files)
 
     def __len__(self):
@@ -476,6 +631,21 @@ class DataCache(RecursiveConfigurationBase):
 
         return fns
 
+    @property
+    def lazy(self):
+        return self._lazy
+
+    @lazy.setter
+    def lazy(self, value):
+        if isinstance(value, bool):
+            self._lazy = value
+        else:
+            raise TypeError('{0} is not boolean'.format(value))
+
+    @property
+    def resolution_deferred(self):
+        return self._resolution_deferred
+
     @property
     def cache(self):
         return self._cache
@@ -484,9 +654,23 @@ class DataCache(RecursiveConfigurationBase):
     def cache(self, value):
         logger.warning('cannot set cache record directly')
 
+    @property
+    def index_names(self):
+        return ('file', 'source') + tuple(self.indexed_fields)
+
     def _clear_cache(self, fn):
+        self._unindex_file(fn)
         self.cache[fn] = []
 
+    def is_loaded(self, fn):
+        return fn in self.cache and not isinstance(self.cache[fn], list)
+
+    def _loaded_file(self, fn):
+        if not self.is_loaded(fn):
+            self.add_file(fn)
+
+        return self.cache[fn]
+
     def ingest(self, files):
         setup = [self._clear_cache(fn)
                  for fn in files
@@ -494,23 +678,401 @@ class DataCache(RecursiveConfigurationBase):
 
         logger.debug('setup cache for {0} files'.format(len(setup)))
 
+        if self.lazy is False:
+            self._add_files(files)
+
+    def _add_files(self, files):
+        # add all files before resolving inheritance, so that resolve() can
+        # order the content in the files.
+        self._add_files_unresolved(files)
+        self.resolve()
+
         for fn in files:
-            self.add_file(fn)
+            self._index_file(fn)
+
+    def _add_files_unresolved(self, files):
+        deferred = self._resolution_deferred
+        self._resolution_deferred = True
+        try:
+            for fn in files:
+                self.add_file(fn)
+        finally:
+            self._resolution_deferred = deferred
+
+            # values are only shared between the files of one load, so that
+            # the table does not keep values from reloaded files alive.
+            if deferred is False:
+                self._shared_values.clear()
+
+    def share_values(self, value):
+        """
+        Returns ``value``, replacing every string, and every tuple, with an
+        equal object from a table kept by the cache, so that content that
+        repeats the same text shares one copy of it. Modifies lists and
+        dictionaries in place. The cache empties the table after loading each
+        group of files.
+        """
+
+        if isinstance(value, basestring):
+            shared = self._shared_values.setdefault(value, value)
+        elif isinstance(value, dict):
+            for key in value:
+                value[key] = self.share_values(value[key])
+            return value
+        elif isinstance(value, list):
+            value[:] = [self.share_values(item) for item in value]
+            return value
+        elif isinstance(value, tuple):
+            value = tuple(self.share_values(item) for item in value)
+            try:
+                shared = self._shared_values.setdefault(value, value)
+            except TypeError:
+                return value
+        else:
+            return value
+
+        # in Python 2, equal str and unicode values share a table entry.
+        if type(shared) is type(value):
+            return shared
+        else:
+            return value
+
+    def load_documents(self, fn):
+        """
+        Returns the documents in ``fn``: from the parsed content cache, if
+        configured, and otherwise as a generator that parses the file one
+        document at a time.
+        """
+
+        if self._parsed_files is None:
+            return iter_yaml_documents(fn)
+        else:
+            return self._parsed_files.load(fn, load_yaml_documents)
 
     def add_file(self, fn):
-        if fn not in self.cache or self.cache[fn] == []:
-            with open(fn, 'r') as f:
-                data = [doc for doc in yaml.safe_load_all(f)]
+        if self.is_loaded(fn):
+            logger.debug('populated file {0} exists in the cache'.format(fn))
+        elif self.resolution_deferred:
+            data = self.load_documents(fn)
 
             self.cache[fn] = self.content_class(data, self, self.conf)
+            self._register_dependencies(fn)
         else:
-            logger.debug('populated file {0} exists in the cache'.format(fn))
+            # add the whole file before resolving any of its content, so that
+            # content can inherit from content in the same file.
+            self._add_files_unresolved([fn])
+            self.resolve([fn])
+
+    def stream_file(self, fn):
+        """
+        Generator that adds the content in ``fn`` to the cache, and yields each
+        content unit as soon as its document is parsed, without reading the
+        whole file first. If the generator stops before the end of the file,
+        the file remains unloaded.
+        """
+
+        if self.is_loaded(fn):
+            content = self.cache[fn]
+            for ref in content.ordering:
+                yield content.content[ref]
+            return
+
+        content = self.content_class([], self, self.conf)
+        self.cache[fn] = content
+
+        completed = False
+        try:
+            for unit in content.ingest_iter(iter_yaml_documents(fn)):
+                yield unit
+            completed = True
+        finally:
+            self._shared_values.clear()
+
+            if completed:
+                self._register_dependencies(fn)
+            else:
+                self._clear_cache(fn)
+
+    def _cached_file_name(self, name):
+        if name in self.cache:
+            return name
+        elif self._file_names.get(name) in self.cache:
+            return self._file_names[name]
+
+        for fn in self.cache:
+            if fn.endswith(name):
+                self._file_names[name] = fn
+                return fn
+
+        return None
+
+    def _find_file(self, name):
+        fn = self._cached_file_name(name)
+        if fn is not None:
+            return fn
+        elif os.path.isfile(name):
+            return name
+
+        for fn in self.set_up_search_path(name):
+            if os.path.isfile(fn):
+                return fn
+
+        return None
+
+    def inheritance_graph(self, files=None):
+        """
+        Returns a mapping of the ``(file, ref)`` of every unresolved content
+        unit in ``files``, or in all loaded files, and in the files they
+        inherit from, to the ``(file, ref)`` of the content it inherits from.
+        Loads, but does not resolve, inherited files that are not in the cache.
+        """
+
+        graph = {}
+        if files is None:
+            files = self.cache
+
+        pending = [fn for fn in files if self.is_loaded(fn)]
+        visited = set(pending)
+
+        while len(pending) > 0:
+            fn = pending.pop()
+
+            for ref, content in self.cache[fn].content.items():
+                source = getattr(content, 'source', None)
+                if source is None or content.is_resolved():
+                    continue
+
+                source_fn = self._find_file(source.file)
+                if source_fn is None:
+                    m = 'cannot find file {0} for content "{1}" in {2}'
+                    m = m.format(source.file, ref, fn)
+                    logger.error(m)
+                    raise InheritableContentError(m)
+                elif not self.is_loaded(source_fn):
+                    self._clear_cache(source_fn)
+                    self._add_files_unresolved([source_fn])
+
+                if source_fn not in visited:
+                    visited.add(source_fn)
+                    pending.append(source_fn)
+
+                if source_fn != fn:
+                    self._dependents.setdefault(source_fn, set()).add(fn)
+
+                graph[(fn, ref)] = (source_fn, source.ref)
+
+        return graph
+
+    @staticmethod
+    def resolution_order(graph):
+        """
+        Returns the nodes of an inheritance graph ordered so that every node
+        follows the node it inherits from. Raises
+        :exc:`InheritableContentError` if the graph contains a cycle.
+        """
+
+        order = []
+        done = set()
+
+        for node in graph:
+            chain = []
+            current = node
+
+            # every unit inherits from at most one other unit, so walking
+            # the chain of parents is enough to find cycles.
+            while current in graph and current not in done:
+                if current in chain:
+                    cycle = chain[chain.index(current):] + [current]
+                    m = 'content inherits from itself: ' + ' -> '.join(
+                        '{0}:{1}'.format(fn, ref) for fn, ref in cycle)
+                    logger.error(m)
+                    raise InheritableContentError(m)
+
+                chain.append(current)
+                current = graph[current]
+
+            for current in reversed(chain):
+                order.append(current)
+                done.add(current)
+
+        return order
+
+    def resolve(self, files=None):
+        """
+        Resolves the inheritance of the content in ``files``, or of all loaded
+        content. Resolves each unit once, after the content it inherits from,
+        and raises :exc:`InheritableContentError` before resolving anything if
+        content inherits from itself.
+        """
+
+        order = self.resolution_order(self.inheritance_graph(files))
+
+        for fn, ref in order:
+            content = self.cache[fn].content[ref]
+            if not content.is_resolved():
+                content.resolve(self)
+
+        logger.debug('resolved {0} content units'.format(len(order)))
+
+    def _register_dependencies(self, fn):
+        for content in self.cache[fn].content.values():
+            source = getattr(content, 'source', None)
+            if source is None:
+                continue
+
+            source_fn = self._cached_file_name(source.file)
+            if source_fn is not None and source_fn != fn:
+                self._dependents.setdefault(source_fn, set()).add(fn)
+
+    def dependents(self, fn):
+        """
+        Returns the set of files with content that inherits, directly or
+        transitively, from content in ``fn``.
+        """
+
+        result = set()
+        queue = list(self._dependents.get(fn, ()))
+
+        while len(queue) > 0:
+            dependent = queue.pop()
+            if dependent in result:
+                continue
+
+            result.add(dependent)
+            queue.extend(self._dependents.get(dependent, ()))
+
+        return result
+
+    def refresh(self, changed_files):
+        """
+        Reparses the files in ``changed_files``, adding files that are not in
+        the cache, and re-resolves the content in all files that inherit from
+        them. Returns the set of reloaded files.
+        """
+
+        affected = set()
+        for fn in changed_files:
+            fn = self._cached_file_name(fn) or fn
+            affected.add(fn)
+            affected.update(self.dependents(fn))
+
+        # files that are not in the cache yet, such as new files, are added.
+        for fn in affected:
+            self._dependents.pop(fn, None)
+            if fn in self.cache or os.path.isfile(fn):
+                self._clear_cache(fn)
+
+        for dependents in self._dependents.values():
+            dependents.difference_update(affected)
+
+        for fn in affected:
+            if not os.path.isfile(fn):
+                logger.info('removing deleted file {0} from the cache'.format(fn))
+                self.cache.pop(fn, None)
+
+        if self.lazy is False:
+            self._add_files(sorted(fn for fn in affected if fn in self.cache))
+
+        logger.debug('refreshed {0} files'.format(len(affected)))
+        return affected
+
+    def index_values(self, fn, content, field):
+        """
+        Returns the list of values that ``content``, from the file ``fn``,
+        has for the index ``field``. Content with a list of values appears in
+        the index under each value.
+        """
+
+        if field == 'file':
+            return [fn]
+        elif field == 'source':
+            if content.source is None:
+                return []
+            else:
+                return [self._cached_file_name(content.source.file) or content.source.file]
+
+        value = content.state.get(field)
+        if value is None:
+            return []
+        elif isinstance(value, list):
+            return value
+        else:
+            return [value]
+
+    def _index_file(self, fn):
+        if fn in self._indexed_files or not self.is_loaded(fn):
+            return
+
+        # subclasses may key content by something other than its ref, so the
+        # index holds the content's key in the file.
+        entries = []
+        for key, content in list(self.cache[fn].content.items()):
+            ref = getattr(content, 'ref', None)
+            if not isinstance(ref, basestring) or ref.startswith('_'):
+                continue
+
+            content = self.cache[fn].fetch(key)
+            for field in self.index_names:
+                for value in self.index_values(fn, content, field):
+                    try:
+                        self._indexes[field].setdefault(value, set()).add((fn, key))
+                    except TypeError:
+                        logger.debug('cannot index unhashable {0} value in {1}'.format(field, ref))
+                        continue
+
+                    entries.append((field, value, key))
+
+        self._indexed_files[fn] = entries
+
+    def _unindex_file(self, fn):
+        for field, value, key in self._indexed_files.pop(fn, ()):
+            index = self._indexes[field]
+            index[value].discard((fn, key))
+            if len(index[value]) == 0:
+                del index[value]
+
+    def query(self, **criteria):
+        """
+        Returns a list of the content units that match all ``criteria``,
+        ordered by file name and ref. Each keyword names an index and
+        specifies a value: for example, ``query(edition='manual',
+        source='steps-source.yaml')``. Loads files that are not yet loaded.
+        """
+
+        for field in criteria:
+            if field not in self._indexes:
+                m = 'cannot query by "{0}", which is not indexed'.format(field)
+                logger.error(m)
+                raise InheritableContentError(m)
+
+        for fn, content in self.file_iter():
+            self._index_file(fn)
+
+        matches = set()
+        if len(criteria) == 0:
+            for found in self._indexes['file'].values():
+                matches.update(found)
+
+        for idx, (field, value) in enumerate(criteria.items()):
+            if field in ('file', 'source'):
+                value = self._cached_file_name(value) or value
+
+            found = self._indexes[field].get(value, ())
+            if idx == 0:
+                matches.update(found)
+            else:
+                matches.intersection_update(found)
+
+            if len(matches) == 0:
+                return []
+
+        return [self.cache[fn].fetch(key) for fn, key in sorted(matches)]
 
     def fetch(self, fn, ref):
         if fn in self.cache:
-            if self.cache[fn] == []:
-                self.add_file(fn)
-            return self.cache[fn].fetch(ref)
+            return self._loaded_file(fn).fetch(ref)
+        elif self._cached_file_name(fn) is not None:
+            return self._loaded_file(self._cached_file_name(fn)).fetch(ref)
         else:
             logger.error('file "{0}" is not included.'.format(fn))
             if os.path.isfile(fn):
@@ -531,19 +1093,80 @@ class DataCache(RecursiveConfigurationBase):
                     raise InheritableContentError('cannot resolve: {0} {1}'.format(fn, ref))
 
     def file_iter(self):
-        for fn in self.cache:
-            yield fn, self.cache[fn]
+        # loading a file can add the files it inherits from to the cache.
+        for fn in list(self.cache):
+            yield fn, self._loaded_file(fn)
 
     def content_iter(self):
-        for fn in self.cache:
-            for data in self.cache[fn].content.values():
+        for fn, content in self.file_iter():
+            for data in content.content.values():
                 if data.ref.startswith('_'):
                     continue
                 else:
                     yield fn, data
 
+    def render_all(self, pool=None, cache=None):
+        """
+        Renders every content unit. If ``pool`` is a :mod:`libgiza.pool`
+        worker pool, the pool renders the content in each file as a separate
+        task, and only the fields that contain tokens go to the workers. If
+        ``cache`` is a :class:`~libgiza.cache.ContentCache`, only content
+        without cached output renders.
+        """
+
+        if pool is None:
+            for fn, data in self.content_iter():
+                data.render(cache=cache)
+            return
+
+        tasks = []
+        files = []
+        cache_keys = {}
+        for fn, content in self.file_iter():
+            chunk = []
+            for key, data in content.content.items():
+                if data.ref.startswith('_'):
+                    continue
+
+                payload = data.render_payload()
+                if payload is None:
+                    data.render(cache=cache)
+                    continue
+                elif len(payload[0]) == 0:
+                    continue
+
+                if cache is not None:
+                    cache_key = render_key(payload[0], payload[1])
+                    rendered = None if cache_key is None else cache.get(cache_key)
+                    if rendered is not None:
+                        data.update_rendered(rendered)
+                        continue
+                    cache_keys[(fn, key)] = cache_key
+
+                # the results refer to content by its key in the file, which
+                # subclasses may not make the content's ref.
+                chunk.append((key, payload[0], payload[1]))
+
+            if len(chunk) > 0:
+                tasks.append(Task(job=render_chunk, args=[chunk],
+                                  description='rendering content in {0}'.format(fn)))
+                files.append(fn)
+
+        logger.debug('rendering content from {0} files'.format(len(tasks)))
+
+        for fn, results in zip(files, pool.runner(tasks)):
+            content = self.cache[fn]
+            for key, fields in results:
+                content.content[key].update_rendered(fields)
+
+                cache_key = cache_keys.get((fn, key))
+                if cache_key is not None:
+                    cache.set(cache_key, fields)
+
 
 class TitleData(ConfigurationBase):
+    __slots__ = ()
+
     _option_registry = ['text']
 
     level_characters = {"=": 1,
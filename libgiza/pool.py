@@ -25,6 +25,8 @@ import multiprocessing.dummy
 import numbers
 import sys
 
+from libgiza.config import (share_configuration, unshare_configuration,
+                            install_shared_configuration)
 from libgiza.task import MapTask, Task
 
 logger = logging.getLogger('giza.pool')
@@ -234,11 +236,30 @@ class ThreadPool(WorkerPool):
 
 
 class ProcessPool(WorkerPool):
-    def __init__(self, pool_size=None):
+    """
+    Runs tasks in worker processes. If ``conf`` is a configuration object,
+    every worker receives a copy of ``conf`` when it starts, and tasks that
+    refer to ``conf`` only send a reference to it.
+    """
+
+    def __init__(self, pool_size=None, conf=None):
         self.pool_size = pool_size
-        self.p = multiprocessing.Pool(self.pool_size)
+        self.conf = conf
+
+        if conf is None:
+            self.p = multiprocessing.Pool(self.pool_size)
+        else:
+            self.p = multiprocessing.Pool(self.pool_size,
+                                          initializer=install_shared_configuration,
+                                          initargs=share_configuration(conf))
         logger.info('new process pool object')
 
+    def close(self):
+        super(ProcessPool, self).close()
+
+        if self.conf is not None:
+            unshare_configuration(self.conf)
+
 
 class EventPool(WorkerPool):
     def __init__(self, pool_size=None):
@@ -0,0 +1,202 @@
+"""
+Provides read-only snapshots of configuration objects, stored in a file that
+processes map into memory. All processes that open a snapshot share the pages
+of the file through the operating system's page cache, and each process only
+decodes the values that it reads.
+
+Create a snapshot with :func:`write_snapshot()`. Snapshots pickle as the
+name of their file, so sending a snapshot to a worker process is cheap.
+
+Snapshots hold the stored values of a configuration object, as
+``dict(safe=False)`` returns them, and not the values that its properties
+compute. Code that reads computed values, such as the ``runstate.force``
+value that :class:`~libgiza.task.Task` falls back to, cannot use a snapshot
+in place of the configuration object. The file's pages are shared, but each
+process decodes its own copy of every value it reads, so snapshots save
+memory in proportion to the values that a process does not read.
+"""
+
+import logging
+import mmap
+import os
+import struct
+
+from libgiza.cache import atomic_write
+from libgiza.config import ConfigurationBase
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+logger = logging.getLogger('libgiza.snapshot')
+
+_magic = b'LIBGIZA-SNAPSHOT-1\n'
+_index_header = struct.Struct('<Q')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_snapshot(conf, fn):
+    """
+    Writes the content of the configuration object ``conf``, as returned by
+    ``conf.dict(safe=False)``, to a snapshot file named ``fn``, and returns a
+    :class:`ConfigurationSnapshot` of the file. Each top-level value is
+    stored separately, so that readers can decode one value at a time. Values
+    that only properties of ``conf`` provide are not stored.
+    """
+
+    index = {}
+    blobs = []
+    offset = 0
+
+    for key, value in conf.dict(safe=False).items():
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        index[key] = (offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+
+    index = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+    atomic_write(fn, b''.join([_magic, _index_header.pack(len(index)), index] + blobs))
+
+    return ConfigurationSnapshot(fn)
+
+
+def thaw(value):
+    """
+    Returns ``value``, a decoded snapshot value, with every dict replaced by
+    a read-only :class:`SnapshotSection`.
+    """
+
+    if isinstance(value, dict):
+        return SnapshotSection(dict((key, thaw(item)) for key, item in value.items()))
+    elif isinstance(value, list):
+        return [thaw(item) for item in value]
+    else:
+        return value
+
+
+class SnapshotSection(ConfigurationBase):
+    """
+    A read-only configuration object that holds a section of a snapshot.
+    Lists in snapshots are copies that belong to the process that reads
+    them: changing them does not change the snapshot.
+    """
+
+    def __init__(self, state):
+        self._source_fn = None
+        self._state = state
+
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
+
+        try:
+            return self.state[key]
+        except KeyError:
+            raise AttributeError('snapshot has no "{0}" value'.format(key))
+
+    def __setattr__(self, key, value):
+        if key.startswith('_'):
+            object.__setattr__(self, key, value)
+        else:
+            m = 'cannot set "{0}" in a read-only configuration snapshot'.format(key)
+            logger.error(m)
+            raise TypeError(m)
+
+    def ingest(self, input_obj):
+        if input_obj is not None:
+            m = 'cannot ingest data into a read-only configuration snapshot'
+            logger.error(m)
+            raise TypeError(m)
+
+
+class ConfigurationSnapshot(SnapshotSection):
+    """
+    A read-only configuration object backed by the snapshot file ``path``,
+    as written by :func:`write_snapshot()`. Decodes each top-level value the
+    first time it is read.
+    """
+
+    def __init__(self, path):
+        self._source_fn = None
+        self._path = path
+        self._values = {}
+
+        start = len(_magic) + _index_header.size
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < start:
+                self._invalid('is not a configuration snapshot')
+
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if self._map[:len(_magic)] != _magic:
+                self._invalid('is not a configuration snapshot')
+
+            index_size = _index_header.unpack(self._map[len(_magic):start])[0]
+            self._data_start = start + index_size
+            if self._data_start > size:
+                self._invalid('is truncated')
+
+            self._index = pickle.loads(self._map[start:self._data_start])
+            for offset, length in self._index.values():
+                if self._data_start + offset + length > size:
+                    self._invalid('is truncated')
+        except SnapshotError:
+            self._map.close()
+            raise
+        except Exception as e:
+            self._map.close()
+            self._invalid('has an invalid index ({0})'.format(e))
+
+    def _invalid(self, problem):
+        m = 'snapshot {0} {1}'.format(self._path, problem)
+        logger.error(m)
+        raise SnapshotError(m)
+
+    def __reduce_ex__(self, protocol):
+        return (ConfigurationSnapshot, (self._path,))
+
+    def __copy__(self):
+        return ConfigurationSnapshot(self._path)
+
+    def __deepcopy__(self, memo):
+        # snapshots are read-only, so a copy only needs its own mapping.
+        result = ConfigurationSnapshot(self._path)
+        memo[id(self)] = result
+        return result
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def state(self):
+        return dict((key, self._load(key)) for key in self._index)
+
+    def __getattr__(self, key):
+        if key.startswith('_') or key not in self._index:
+            raise AttributeError('snapshot has no "{0}" value'.format(key))
+
+        return self._load(key)
+
+    def _load(self, key):
+        if key not in self._values:
+            offset, length = self._index[key]
+            offset += self._data_start
+            self._values[key] = thaw(pickle.loads(self._map[offset:offset + length]))
+
+        return self._values[key]
+
+    def close(self):
+        self._map.close()
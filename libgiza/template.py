@@ -0,0 +1,233 @@
+"""
+Provides the template rendering used to process replacement tokens in
+structured content. Compiled templates are kept in a bounded cache, keyed by
+the template source, so that templates shared by many content units are only
+compiled once.
+
+Most templates in structured content only substitute variables
+(e.g. ``{{ name }}``). These templates compile to a :class:`SimpleTemplate`,
+which renders by joining strings, and only templates that use other Jinja
+features compile to full Jinja templates.
+"""
+
+import collections
+import logging
+import re
+import sys
+import threading
+
+import jinja2
+import jinja2.meta
+
+logger = logging.getLogger('libgiza.template')
+
+if sys.version_info >= (3, 0):
+    basestring = str
+    unicode = str
+
+_simple_token = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+_template_syntax = ('{{', '{%', '{#')
+_reserved_names = frozenset(['true', 'false', 'none', 'True', 'False', 'None',
+                             'and', 'or', 'not', 'in', 'is', 'if', 'else'])
+
+
+class TemplateError(Exception):
+    """
+    Exception raised when replacement values cannot be resolved.
+    """
+
+    pass
+
+
+class SimpleTemplate(object):
+    """
+    A template made up of literal text and ``{{ name }}`` placeholders, which
+    renders the same output as the equivalent Jinja template.
+    """
+
+    def __init__(self, parts, environment):
+        self.parts = parts
+        self.environment = environment
+
+    def render(self, **replacement):
+        output = list(self.parts)
+        env_globals = self.environment.globals
+
+        # parts alternate between literal text and placeholder names.
+        for idx in range(1, len(output), 2):
+            name = output[idx]
+            if name in replacement:
+                output[idx] = unicode(replacement[name])
+            elif name in env_globals:
+                output[idx] = unicode(env_globals[name])
+            else:
+                output[idx] = ''
+
+        return ''.join(output)
+
+
+def compile_simple_template(source, environment):
+    """
+    Returns a :class:`SimpleTemplate` for ``source``, or ``None`` if
+    ``source`` uses any template features besides variable placeholders.
+    """
+
+    # Jinja normalizes line endings, and strips a single trailing newline.
+    if '\r' in source:
+        return None
+    elif source.endswith('\n') and not environment.keep_trailing_newline:
+        source = source[:-1]
+
+    parts = _simple_token.split(source)
+
+    for idx, part in enumerate(parts):
+        if idx % 2 == 1:
+            if part in _reserved_names:
+                return None
+        else:
+            for syntax in _template_syntax:
+                if syntax in part:
+                    return None
+
+    return SimpleTemplate(parts, environment)
+
+
+class TemplateCache(object):
+    """
+    A least-recently-used cache of compiled templates. All templates in the
+    cache share a single :class:`jinja2.Environment`. When ``fast_path`` is
+    ``True``, templates that only substitute variables compile to
+    :class:`SimpleTemplate` objects.
+    """
+
+    def __init__(self, size=1024, environment=None, fast_path=True):
+        if environment is None:
+            environment = jinja2.Environment()
+
+        self.environment = environment
+        self.size = size
+        self.fast_path = fast_path
+        self._templates = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, source):
+        return source in self._templates
+
+    def get(self, source):
+        """Returns the compiled template for ``source``."""
+
+        with self._lock:
+            if source in self._templates:
+                template = self._templates.pop(source)
+                self._templates[source] = template
+                return template
+
+        template = None
+        if self.fast_path is True:
+            template = compile_simple_template(source, self.environment)
+
+        if template is None:
+            template = self.environment.from_string(source)
+
+        with self._lock:
+            self._templates[source] = template
+            while len(self._templates) > self.size:
+                self._templates.popitem(last=False)
+
+        return template
+
+    def render(self, source, replacement):
+        return self.get(source).render(**replacement)
+
+    def names(self, source):
+        """Returns the set of variable names that the template ``source`` uses."""
+
+        template = self.get(source)
+        if isinstance(template, SimpleTemplate):
+            return set(template.parts[1::2])
+        else:
+            return jinja2.meta.find_undeclared_variables(self.environment.parse(source))
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+templates = TemplateCache()
+
+
+def render_template(source, replacement):
+    """Renders ``source`` with the ``replacement`` mapping, using the shared cache."""
+
+    return templates.render(source, replacement)
+
+
+def has_template_syntax(value):
+    return isinstance(value, basestring) and '{{' in value
+
+
+def resolve_replacements(replacement, cache=None):
+    """
+    Returns a copy of the ``replacement`` mapping where every value that
+    refers to other values in the mapping is rendered, including strings in
+    dict and list values, so that a single pass of rendering with the result
+    substitutes all tokens. Raises :exc:`TemplateError` if values refer to
+    each other in a cycle.
+    """
+
+    if cache is None:
+        cache = templates
+
+    resolved = {}
+
+    def template_strings(value):
+        if has_template_syntax(value):
+            yield value
+        elif isinstance(value, dict):
+            for item in value.values():
+                for source in template_strings(item):
+                    yield source
+        elif isinstance(value, list):
+            for item in value:
+                for source in template_strings(item):
+                    yield source
+
+    def render(value):
+        if has_template_syntax(value):
+            return cache.render(value, resolved)
+        elif isinstance(value, dict):
+            return dict((key, render(item)) for key, item in value.items())
+        elif isinstance(value, list):
+            return [render(item) for item in value]
+        else:
+            return value
+
+    def resolve(key, path):
+        if key in resolved:
+            return
+        elif key in path:
+            cycle = path[path.index(key):] + [key]
+            raise TemplateError('replacement values form a cycle: ' + ' -> '.join(cycle))
+
+        value = replacement[key]
+        sources = list(template_strings(value))
+        if len(sources) == 0:
+            resolved[key] = value
+            return
+
+        path.append(key)
+        for source in sources:
+            for name in cache.names(source):
+                if name in replacement:
+                    resolve(name, path)
+        path.pop()
+
+        resolved[key] = render(value)
+
+    for key in replacement:
+        resolve(key, [])
+
+    return resolved
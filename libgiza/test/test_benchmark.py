@@ -0,0 +1,35 @@
+import unittest
+
+import libgiza.benchmark
+import libgiza.template
+from libgiza.config import ConfigurationBase
+from libgiza.inheritance import InheritableContentBase
+
+
+class TestBenchmarkWorkloads(unittest.TestCase):
+    def test_template_sources_substitute_every_placeholder(self):
+        replacement = {'program': 'mongod', 'command': 'run', 'option': 'fork'}
+
+        for idx, source in enumerate(libgiza.benchmark.template_sources(3)):
+            self.assertEqual('To run mongod for example {0}, use the run command:\n'
+                             '   mongod --fork'.format(idx),
+                             libgiza.template.render_template(source, replacement))
+
+    def test_baseline_content_is_unslotted_with_copied_keys(self):
+        doc = libgiza.benchmark.content_documents(1)[0]
+        unit = libgiza.benchmark.UnslottedContent(doc, ConfigurationBase())
+        interned = InheritableContentBase(libgiza.benchmark.content_documents(1)[0],
+                                          ConfigurationBase())
+
+        self.assertIn('_state', unit.__dict__)
+        self.assertEqual(interned.state.keys(), unit.state.keys())
+        pairs = zip(sorted(unit.state), sorted(interned.state))
+        self.assertFalse(any(key is other for key, other in pairs))
+
+    @unittest.skipIf(libgiza.benchmark.tracemalloc is None, 'requires tracemalloc')
+    def test_memory_benchmark_reports_baseline(self):
+        results = dict((name, value) for name, value, unit
+                       in libgiza.benchmark.benchmark_memory(count=100))
+
+        self.assertLess(results['content'], results['baseline'])
+        self.assertGreater(results['reduction'], 0)
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import libgiza.cache
+
+
+class CountingParser(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, fn):
+        self.calls += 1
+        with open(fn, 'r') as f:
+            return {"lines": f.read().split('\n')}
+
+
+class TestParsedFileCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, "source.txt")
+        self.write_source("a\nb")
+
+        self.parser = CountingParser()
+        self.cache = libgiza.cache.ParsedFileCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_source(self, content):
+        with open(self.fn, 'w') as f:
+            f.write(content)
+
+    def test_unchanged_files_are_parsed_once(self):
+        first = self.cache.load(self.fn, self.parser)
+        second = self.cache.load(self.fn, self.parser)
+
+        self.assertEqual(1, self.parser.calls)
+        self.assertEqual(first, second)
+        self.assertIn(self.fn, self.cache)
+
+    def test_cached_values_are_copies(self):
+        self.cache.load(self.fn, self.parser)["lines"].append("c")
+
+        self.assertEqual(["a", "b"], self.cache.load(self.fn, self.parser)["lines"])
+
+    def test_changed_files_are_reparsed(self):
+        self.cache.load(self.fn, self.parser)
+        self.write_source("a\nb\nc")
+        mtime = time.time() + 10
+        os.utime(self.fn, (mtime, mtime))
+
+        self.assertEqual(["a", "b", "c"], self.cache.load(self.fn, self.parser)["lines"])
+        self.assertEqual(2, self.parser.calls)
+
+    def test_entries_persist_on_disk(self):
+        path = os.path.join(self.dir, "cache")
+        libgiza.cache.ParsedFileCache(path).load(self.fn, self.parser)
+        self.assertEqual(1, len(os.listdir(path)))
+
+        data = libgiza.cache.ParsedFileCache(path).load(self.fn, self.parser)
+        self.assertEqual(1, self.parser.calls)
+        self.assertEqual(["a", "b"], data["lines"])
+
+    def test_discard_removes_entries(self):
+        self.cache.load(self.fn, self.parser)
+        self.cache.discard(self.fn)
+
+        self.assertNotIn(self.fn, self.cache)
+        self.assertEqual(0, len(self.cache))
+
+
+class TestContentCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = libgiza.cache.ContentCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_keys_depend_on_content(self):
+        key = libgiza.cache.content_key({"a": 1, "b": [1, 2]})
+
+        self.assertEqual(key, libgiza.cache.content_key({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(key, libgiza.cache.content_key({"a": 2, "b": [1, 2]}))
+
+    def test_unserializable_values_have_no_key(self):
+        self.assertIsNone(libgiza.cache.content_key({"a": object()}))
+        self.assertIsNone(libgiza.cache.content_key([libgiza.cache.ContentCache()]))
+
+    def test_values_with_ambiguous_json_have_no_key(self):
+        self.assertIsNone(libgiza.cache.content_key({1: "a"}))
+        self.assertIsNone(libgiza.cache.content_key({"a": [(1, 2)]}))
+        self.assertIsNotNone(libgiza.cache.content_key({"1": "a", "b": [[1, 2]]}))
+
+    def test_cached_values_are_copies(self):
+        self.cache.set("key", {"lines": ["a"]})
+        self.cache.get("key")["lines"].append("b")
+
+        self.assertEqual(["a"], self.cache.get("key")["lines"])
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_entries_persist_on_disk(self):
+        path = os.path.join(self.dir, "cache")
+        libgiza.cache.ContentCache(path).set("key", "value")
+
+        cache = libgiza.cache.ContentCache(path)
+        self.assertIn("key", cache)
+        self.assertEqual("value", cache.get("key"))
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, "output.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replaces_content_and_keeps_permissions(self):
+        with open(self.fn, 'w') as f:
+            f.write("old")
+        os.chmod(self.fn, 0o640)
+
+        libgiza.cache.atomic_write(self.fn, b"new")
+
+        with open(self.fn) as f:
+            self.assertEqual("new", f.read())
+        self.assertEqual(0o640, os.stat(self.fn).st_mode & 0o777)
+        self.assertEqual(["output.txt"], os.listdir(self.dir))
+
+    def test_new_files_use_the_umask(self):
+        umask = os.umask(0o027)
+        try:
+            libgiza.cache.atomic_write(self.fn, b"new")
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(0o640, os.stat(self.fn).st_mode & 0o777)
+
+    def test_writes_through_symbolic_links(self):
+        with open(self.fn, 'w') as f:
+            f.write("old")
+
+        link = os.path.join(self.dir, "link.txt")
+        os.symlink(self.fn, link)
+        libgiza.cache.atomic_write(link, b"new")
+
+        self.assertTrue(os.path.islink(link))
+        with open(self.fn) as f:
+            self.assertEqual("new", f.read())
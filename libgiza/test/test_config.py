@@ -1,7 +1,11 @@
+import copy
+import pickle
 import unittest
 import tempfile
 
 import libgiza.config
+from libgiza.pool import ProcessPool
+from libgiza.task import Task
 
 
 class TestConfigurationObjectPersistance(unittest.TestCase):
@@ -33,6 +37,51 @@ class TestConfigurationObjectPersistance(unittest.TestCase):
             d = self.conf(f.name)
             self.assertEquals(d._test_data, 43)
 
+    def test_unchanged_objects_are_not_written(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json") as f:
+            f.write('{"_test_data":    42}')
+            f.flush()
+
+            with self.conf.persisting(f.name) as data:
+                self.assertEquals(data._test_data, 42)
+
+            with open(f.name) as source:
+                self.assertEqual('{"_test_data":    42}', source.read())
+
+    def test_compact_output(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json") as f:
+            f.write('{}')
+            f.flush()
+
+            with self.conf.persisting(f.name, compact=True) as data:
+                data.state["_test_data"] = [1, 2]
+
+            with open(f.name) as source:
+                self.assertEqual('{"_test_data":[1,2]}', source.read())
+
+
+class TestParsedConfigurationFiles(unittest.TestCase):
+    def test_parsed_files_are_shared_as_copies(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".yaml") as f:
+            f.write('option: [1, 2]\n')
+            f.flush()
+
+            first = RegistryConfiguration(f.name)
+            self.assertIn(f.name, libgiza.config.parsed_files)
+
+            first.option.append(3)
+            self.assertEqual([1, 2], RegistryConfiguration(f.name).option)
+
+    def test_written_files_are_reparsed(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json") as f:
+            f.write('{"option": 1}')
+            f.flush()
+
+            with RegistryConfiguration.persisting(f.name) as data:
+                data.option = 2
+
+            self.assertEqual(2, RegistryConfiguration(f.name).option)
+
 
 class TestConfigurationObjectMembership(unittest.TestCase):
     def setUp(self):
@@ -46,3 +95,355 @@ class TestConfigurationObjectMembership(unittest.TestCase):
 
         self.assertIn("_foo", self.conf)
         self.assertNotIn("_foo", self.conf.state)
+
+
+class RegistryConfiguration(libgiza.config.ConfigurationBase):
+    __slots__ = ()
+
+    _option_registry = ['option']
+
+
+class TestCompactConfigurationObjects(unittest.TestCase):
+    def test_ingested_keys_are_interned(self):
+        key = ''.join(['opt', 'ion'])
+        conf = RegistryConfiguration({key: 1})
+
+        self.assertIs(list(conf.state.keys())[0], 'option')
+
+    def test_slotted_objects_support_registry_and_internal_values(self):
+        conf = RegistryConfiguration()
+        conf.option = 42
+        conf._internal = True
+
+        self.assertEqual(42, conf.option)
+        self.assertTrue(conf._internal)
+
+
+class TestAttributeDispatch(unittest.TestCase):
+    def setUp(self):
+        self.conf = RegistryConfiguration()
+
+    def test_class_attribute_tables(self):
+        self.assertEqual(RegistryConfiguration._registry_keys, frozenset(['option']))
+        self.assertIn('state', RegistryConfiguration._class_attributes)
+
+    def test_undefined_registry_value(self):
+        with self.assertRaises(AttributeError):
+            self.conf.option
+
+    def test_unknown_key(self):
+        with self.assertRaises(TypeError):
+            self.conf.unknown = 1
+
+        with self.assertRaises(AttributeError):
+            self.conf.unknown
+
+    def test_registry_keys_added_after_class_creation(self):
+        conf = libgiza.config.ConfigurationBase()
+        conf._option_registry = ['added']
+        conf.added = 1
+
+        self.assertEqual(1, conf.added)
+        self.assertEqual({'added': 1}, conf.state)
+
+
+def recorded_property(name):
+    def getter(self):
+        return self.state[name]
+
+    def setter(self, value):
+        self._calls.append(name)
+        self.state[name] = value
+
+    return property(getter, setter)
+
+
+class OrderedConfiguration(libgiza.config.ConfigurationBase):
+    _option_registry = ['option']
+    _ingest_order = ['second', 'first']
+
+    def __init__(self, input_obj=None):
+        self._calls = []
+        super(OrderedConfiguration, self).__init__(input_obj)
+
+    first = recorded_property('first')
+    second = recorded_property('second')
+    third = recorded_property('third')
+    fourth = recorded_property('fourth')
+
+
+class OverridingConfiguration(libgiza.config.ConfigurationBase):
+    _option_registry = ['alpha', 'zulu']
+
+    @property
+    def middle(self):
+        return self.state['middle']
+
+    @middle.setter
+    def middle(self, value):
+        self.state['middle'] = sorted(self.state)
+        self.state['alpha'] = value
+        self.state['zulu'] = value
+
+
+class TestBulkIngestion(unittest.TestCase):
+    def test_setters_follow_declared_order(self):
+        conf = OrderedConfiguration({'first': 1, 'second': 2, 'third': 3, 'fourth': 4})
+
+        self.assertEqual(['second', 'first', 'third', 'fourth'], conf._calls)
+        self.assertEqual(3, conf.third)
+
+    def test_registry_values_are_available_to_setters(self):
+        conf = OrderedConfiguration({'option': 1, 'first': 2})
+
+        self.assertEqual(['first'], conf._calls)
+        self.assertEqual({'option': 1, 'first': 2}, conf.state)
+
+    def test_registry_values_keep_their_order_with_setters(self):
+        # keys are ingested in reverse order: zulu, middle, and then alpha.
+        conf = OverridingConfiguration({'alpha': 'a', 'middle': 'm', 'zulu': 'z'})
+
+        self.assertEqual(['zulu'], conf.middle)
+        self.assertEqual('a', conf.alpha)
+        self.assertEqual('m', conf.zulu)
+
+    def test_unknown_keys_are_rejected(self):
+        with self.assertRaises(TypeError):
+            RegistryConfiguration({'option': 1, 'unknown': 2})
+
+
+class SectionConfiguration(libgiza.config.RecursiveConfigurationBase):
+    _option_registry = ['name', 'password']
+
+
+class LazyConfiguration(libgiza.config.ConfigurationBase):
+    _option_registry = ['option']
+
+    section = libgiza.config.LazySection(SectionConfiguration)
+
+
+class TestLazySections(unittest.TestCase):
+    def setUp(self):
+        self.conf = LazyConfiguration({'option': 1, 'section': {'name': 'first'}})
+
+    def test_sections_are_stored_raw(self):
+        self.assertEqual({'name': 'first'}, self.conf.state['section'])
+
+    def test_sections_are_constructed_on_access(self):
+        section = self.conf.section
+
+        self.assertIsInstance(section, SectionConfiguration)
+        self.assertIs(self.conf, section.conf)
+        self.assertEqual('first', section.name)
+        self.assertIs(section, self.conf.section)
+
+    def test_descriptor_names(self):
+        self.assertEqual('section', LazyConfiguration.section.name)
+        self.assertEqual(frozenset(['section']), LazyConfiguration._lazy_sections)
+
+    def test_missing_sections(self):
+        with self.assertRaises(AttributeError):
+            LazyConfiguration().section
+
+    def test_invalid_values(self):
+        with self.assertRaises(TypeError):
+            self.conf.section = 42
+
+    def test_dict_output_matches_constructed_sections(self):
+        self.conf.state['section']['password'] = 'secret'
+
+        self.assertEqual({'option': 1, 'section': {'name': 'first', 'password': 'redacted'}},
+                         self.conf.dict())
+
+
+class CachedConfiguration(libgiza.config.ConfigurationBase):
+    _option_registry = ['root', 'branch', 'other']
+
+    def __init__(self, input_obj=None):
+        self._computed = 0
+        super(CachedConfiguration, self).__init__(input_obj)
+
+    @libgiza.config.cached_property(depends=['root', 'branch'])
+    def output(self):
+        self._computed += 1
+        return '/'.join([self.root, self.branch])
+
+    @libgiza.config.cached_property
+    def keys(self):
+        return sorted(self.state)
+
+
+class TestCachedProperties(unittest.TestCase):
+    def setUp(self):
+        self.conf = CachedConfiguration({'root': 'build', 'branch': 'master'})
+
+    def test_values_are_computed_once(self):
+        self.assertEqual('build/master', self.conf.output)
+        self.assertEqual('build/master', self.conf.output)
+        self.assertEqual(1, self.conf._computed)
+
+    def test_setting_dependencies_discards_values(self):
+        self.assertEqual('build/master', self.conf.output)
+
+        self.conf.other = 1
+        self.assertEqual('build/master', self.conf.output)
+        self.assertEqual(1, self.conf._computed)
+
+        self.conf.branch = 'v1'
+        self.assertEqual('build/v1', self.conf.output)
+
+        self.conf.ingest({'root': 'out'})
+        self.assertEqual('out/v1', self.conf.output)
+        self.assertEqual(3, self.conf._computed)
+
+    def test_properties_without_dependencies(self):
+        self.assertEqual(['branch', 'root'], self.conf.keys)
+
+        self.conf.other = 1
+        self.assertEqual(['branch', 'other', 'root'], self.conf.keys)
+
+    def test_properties_are_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.conf.output = 'other'
+
+        self.assertEqual('build/master', self.conf.output)
+
+    def test_internal_attributes_do_not_discard_values(self):
+        keys = self.conf.keys
+        self.conf._source_fn = 'conf.yaml'
+
+        self.assertIs(keys, self.conf.keys)
+
+    def test_dependency_table(self):
+        self.assertEqual({'root': set(['output']), 'branch': set(['output'])},
+                         CachedConfiguration._cache_dependents)
+        self.assertEqual(frozenset(['keys']), CachedConfiguration._cache_discard_always)
+
+
+class CustomDictConfiguration(libgiza.config.ConfigurationBase):
+    def dict(self):
+        return {'custom': True}
+
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        self.conf = RegistryConfiguration()
+
+    def test_internal_and_secret_values(self):
+        conf = SectionConfiguration({'name': 'a', 'password': 'b'}, self.conf)
+        conf._hidden = 1
+        conf.state['_id'] = 2
+        conf.state['_other'] = 3
+
+        self.assertEqual({'name': 'a', 'password': 'redacted', '_id': 2}, conf.dict())
+        self.assertEqual({'name': 'a', 'password': 'b', '_id': 2, '_other': 3},
+                         conf.dict(safe=False))
+
+    def test_nested_values(self):
+        section = SectionConfiguration({'password': 'b'}, self.conf)
+        self.conf.option = {'section': section, 'items': [section], 'value': None}
+
+        self.assertEqual({'option': {'section': {'password': 'redacted'},
+                                     'items': [{'password': 'redacted'}],
+                                     'value': 'error'}},
+                         self.conf.dict(safe=False))
+
+    def test_shared_and_cyclic_values(self):
+        shared = {'a': 1}
+        self.conf.option = [self.conf, CustomDictConfiguration()]
+        self.conf.state['first'] = shared
+        self.conf.state['second'] = shared
+
+        d = self.conf.dict()
+        self.assertEqual(['cycle', {'custom': True}], d['option'])
+        self.assertEqual(d['first'], d['second'])
+
+        d['first']['a'] = 5
+        self.assertEqual({'a': 1}, d['second'])
+
+    def test_custom_dict_methods(self):
+        self.assertEqual({'custom': True}, CustomDictConfiguration().dict())
+        self.assertEqual([{'custom': True}],
+                         self.conf.__get_dict_value__([CustomDictConfiguration()]))
+
+    def test_repr_lists_keys(self):
+        self.conf.option = 1
+        self.assertEqual('<RegistryConfiguration: option>', repr(self.conf))
+
+    def test_yaml_output_does_not_use_aliases(self):
+        shared = {'a': 1}
+        self.conf.option = [shared, shared]
+
+        with tempfile.NamedTemporaryFile(suffix=".yaml") as f:
+            self.conf.write(f.name)
+            self.assertNotIn('&', open(f.name).read())
+            self.assertEqual({'option': [shared, shared]},
+                             RegistryConfiguration(f.name).dict())
+
+
+def read_option(conf):
+    return conf.option
+
+
+class TestSharedConfigurations(unittest.TestCase):
+    def setUp(self):
+        self.conf = RegistryConfiguration({'option': list(range(1000))})
+
+    def tearDown(self):
+        libgiza.config.unshare_configuration(self.conf)
+
+    def test_shared_objects_pickle_as_references(self):
+        full_size = len(pickle.dumps(self.conf))
+        token, payload = libgiza.config.share_configuration(self.conf)
+
+        self.assertIs(self.conf, pickle.loads(pickle.dumps(self.conf)))
+        self.assertLess(len(pickle.dumps(self.conf)), full_size // 10)
+        self.assertEqual(self.conf.dict(), pickle.loads(payload).dict())
+
+        libgiza.config.unshare_configuration(self.conf)
+        self.assertIsNot(self.conf, pickle.loads(pickle.dumps(self.conf)))
+
+    def test_shared_objects_copy_normally(self):
+        libgiza.config.share_configuration(self.conf)
+
+        for copied in (copy.copy(self.conf), copy.deepcopy(self.conf)):
+            self.assertIsNot(self.conf, copied)
+            self.assertEqual(self.conf.option, copied.option)
+            self.assertIsNot(self.conf, pickle.loads(pickle.dumps(copied)))
+
+        copied = copy.deepcopy(self.conf)
+        copied.option.append(1000)
+        self.assertEqual(len(self.conf.option), 1000)
+
+    def test_shares_are_counted(self):
+        first = libgiza.config.share_configuration(self.conf)
+        second = libgiza.config.share_configuration(self.conf)
+        self.assertEqual(first, second)
+
+        libgiza.config.unshare_configuration(self.conf)
+        self.assertIs(self.conf, pickle.loads(pickle.dumps(self.conf)))
+
+        libgiza.config.unshare_configuration(self.conf)
+        self.assertIsNot(self.conf, pickle.loads(pickle.dumps(self.conf)))
+
+    def test_installed_configurations(self):
+        token, payload = libgiza.config.share_configuration(self.conf)
+        libgiza.config.install_shared_configuration('installed', payload)
+
+        installed = libgiza.config.shared_configuration('installed')
+        self.assertIsNot(self.conf, installed)
+        self.assertEqual(self.conf.option, installed.option)
+
+        libgiza.config.unshare_configuration(installed)
+        with self.assertRaises(libgiza.config.ConfigurationError):
+            libgiza.config.shared_configuration('installed')
+
+    def test_process_pool_workers_receive_configuration(self):
+        pool = ProcessPool(2, conf=self.conf)
+        try:
+            results = pool.runner([Task(job=read_option, args=[self.conf])])
+        finally:
+            pool.close()
+
+        self.assertEqual([self.conf.option], results)
+        self.assertNotIn('_share_token', self.conf.__dict__)
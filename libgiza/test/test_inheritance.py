@@ -13,11 +13,15 @@
 # limitations under the License.
 
 import os
+import shutil
+import tempfile
 
 from unittest import TestCase
 
-from libgiza.inheritance import (DataContentBase, DataCache,
+from libgiza.cache import ContentCache
+from libgiza.inheritance import (DataContentBase, DataCache, render_key,
                                  InheritableContentError, InheritableContentBase)
+from libgiza.pool import SerialPool, ThreadPool
 
 from giza.config.main import Configuration
 from giza.config.runtime import RuntimeStateConfig
@@ -124,6 +128,68 @@ class TestDataCache(TestCase):
 
         self.assertEqual(len(self.data.cache), len(self.files))
 
+    def test_parsed_content_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            first = self.DataCache(self.files, self.c, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), len(self.files))
+
+            second = self.DataCache(self.files, self.c, cache_dir=cache_dir)
+            for fn, content in first.file_iter():
+                self.assertEqual(set(content.content), set(second.cache[fn].content))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_stream_file(self):
+        fn = self.files[0]
+        stream = self.data.stream_file(fn)
+
+        first = next(stream)
+        self.assertEqual(first.ref, 'one-first')
+        self.assertIs(self.data.cache[fn].content['one-first'], first)
+
+        self.assertEqual([content.ref for content in stream], ['one-second'])
+        self.assertTrue(self.data.is_loaded(fn))
+        self.assertEqual([content.ref for content in self.data.stream_file(fn)],
+                         ['one-first', 'one-second'])
+
+    def test_stopped_stream_leaves_file_unloaded(self):
+        fn = self.files[0]
+        stream = self.data.stream_file(fn)
+        next(stream)
+        stream.close()
+
+        self.assertIn(fn, self.data)
+        self.assertFalse(self.data.is_loaded(fn))
+
+    def test_ingest_from_generator(self):
+        docs = ({'ref': 'doc-{0}'.format(idx), 'pre': 'text'} for idx in range(3))
+        content = self.DataContentBase(docs, self.data, self.c)
+
+        self.assertEqual(content.ordering, ['doc-0', 'doc-1', 'doc-2'])
+
+    def test_repeated_values_are_shared(self):
+        self.data.ingest(self.files)
+
+        one = self.data.fetch(self.files[0], 'one-first')
+        two = self.data.fetch(self.files[1], 'two-first')
+
+        self.assertEqual(one.pre, two.pre)
+        self.assertIs(one.pre, two.pre)
+        self.assertIs(one.post, two.post)
+
+    def test_share_values(self):
+        text = ''.join(['shared', ' text'])
+        doc = {'a': 'shared text', 'b': [text, 1], 'c': {'d': (text,)}}
+
+        self.data.share_values(('shared text',))
+        result = self.data.share_values(doc)
+
+        self.assertIs(result, doc)
+        self.assertIs(doc['a'], doc['b'][0])
+        self.assertIs(doc['c']['d'][0], doc['a'])
+        self.assertIs(doc['c']['d'], self.data.share_values(('shared text',)))
+
     def test_fetch_without_adding_file(self):
         self.assertEqual(self.data.cache, {})
 
@@ -134,6 +200,44 @@ class TestDataCache(TestCase):
                 self.assertNotIn(fn, self.data)
 
 
+class TestLazyDataCache(TestCase):
+    def setUp(self):
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.c.paths = {'includes': get_test_file_path()}
+
+        self.files = get_inheritance_data_files()
+        self.data = DataCache(self.files, self.c, lazy=True)
+
+    def test_files_are_not_loaded(self):
+        self.assertEqual(len(self.data), len(self.files))
+
+        for fn in self.files:
+            self.assertIn(fn, self.data)
+            self.assertFalse(self.data.is_loaded(fn))
+
+    def test_fetch_loads_file(self):
+        one, two, three = self.files
+
+        self.assertEqual(self.data.fetch(one, 'one-first').ref, 'one-first')
+        self.assertTrue(self.data.is_loaded(one))
+        self.assertFalse(self.data.is_loaded(two))
+
+    def test_fetch_loads_inherited_files(self):
+        one, two, three = self.files
+
+        self.data.fetch(three, 'three-first')
+        self.assertTrue(self.data.is_loaded(two))
+        self.assertFalse(self.data.is_loaded(one))
+
+    def test_iteration_loads_all_files(self):
+        refs = set(data.ref for fn, data in self.data.content_iter())
+
+        self.assertEqual(len(refs), 6)
+        for fn in self.files:
+            self.assertTrue(self.data.is_loaded(fn))
+
+
 class TestDataContentBase(TestCase):
     def setUp(self):
         self.c = Configuration()
@@ -197,6 +301,67 @@ class TestDataContentBase(TestCase):
         print(collection.content)
 
 
+class NumberedContent(InheritableContentBase):
+    __slots__ = ()
+
+    _option_registry = InheritableContentBase._option_registry + ['number']
+
+
+class NumberedDataContent(DataContentBase):
+    content_class = NumberedContent
+
+
+class ProgramContent(InheritableContentBase):
+    __slots__ = ()
+
+    _option_registry = InheritableContentBase._option_registry + ['program', 'name']
+
+
+class ProgramDataContent(DataContentBase):
+    """Keys content by ``(program, name)``, rather than by ref, as giza's option files do."""
+
+    content_class = ProgramContent
+
+    def add(self, doc):
+        content = self.content_class(doc, self.conf)
+        content.ref = '-'.join((content.program, content.name))
+        self.content[(content.program, content.name)] = content
+
+        return content
+
+
+class ProgramDataCache(DataCache):
+    content_class = ProgramDataContent
+
+
+class TestOrderedContent(TestCase):
+    def setUp(self):
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.data = DataCache([], self.c)
+
+    def test_numbered_content_is_sorted(self):
+        content = NumberedDataContent([{'ref': 'c', 'number': 3}, {'ref': 'a', 'number': 1},
+                                       {'ref': 'b', 'number': 2}, {'ref': 'd', 'number': 2}],
+                                      self.data, self.c)
+
+        self.assertEqual([item.ref for item in content.ordered_content()], ['a', 'b', 'd', 'c'])
+        self.assertEqual(content.ordering, ['a', 'b', 'd', 'c'])
+
+    def test_unnumbered_content_keeps_file_order(self):
+        content = NumberedDataContent([{'ref': 'c', 'number': 3}, {'ref': 'a'}],
+                                      self.data, self.c)
+
+        self.assertEqual([item.ref for item in content.ordered_content()], ['c', 'a'])
+
+    def test_ordering_updates_after_adding_content(self):
+        content = NumberedDataContent([{'ref': 'b', 'number': 2}], self.data, self.c)
+        self.assertEqual([item.ref for item in content.ordered_content()], ['b'])
+
+        content.ingest([{'ref': 'a', 'number': 1}])
+        self.assertEqual([item.ref for item in content.ordered_content()], ['a', 'b'])
+
+
 class TestInheritedContentResolution(TestCase):
     def setUp(self):
         self.c = Configuration()
@@ -232,6 +397,303 @@ class TestInheritedContentResolution(TestCase):
                     self.assertTrue(doc.source.resolved)
 
 
+class TestIncrementalRefresh(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for fn in get_inheritance_data_files():
+            shutil.copy(fn, self.dir)
+
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.c.paths = {'includes': self.dir}
+
+        self.files = [os.path.join(self.dir, os.path.basename(fn))
+                      for fn in get_inheritance_data_files()]
+        self.one, self.two, self.three = self.files
+        self.data = DataCache(self.files, self.c)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_dependency_index(self):
+        self.assertEqual(self.data.dependents(self.two), set([self.three]))
+        self.assertEqual(self.data.dependents(self.one), set())
+
+    def test_refresh_reloads_dependents(self):
+        with open(self.two, 'w') as f:
+            f.write('ref: two-first\npre: first\n---\nref: two-second\npre: changed\n')
+
+        self.assertEqual(self.data.refresh([self.two]), set([self.two, self.three]))
+        self.assertEqual(self.data.fetch(self.two, 'two-second').pre, 'changed')
+        self.assertEqual(self.data.fetch(self.three, 'three-first').pre, 'changed')
+        self.assertEqual(self.data.dependents(self.two), set([self.three]))
+
+    def test_refresh_adds_new_files(self):
+        new = os.path.join(self.dir, 'example-add-four.yaml')
+        with open(new, 'w') as f:
+            f.write('ref: four-first\nsource:\n  file: example-add-two.yaml\n  ref: two-second\n')
+
+        self.assertEqual(self.data.refresh([new]), set([new]))
+        self.assertIn(new, self.data)
+        self.assertEqual(self.data.fetch(new, 'four-first').pre,
+                         self.data.fetch(self.two, 'two-second').pre)
+        self.assertEqual(self.data.dependents(self.two), set([self.three, new]))
+
+    def test_refresh_releases_shared_values(self):
+        self.assertEqual(len(self.data._shared_values), 0)
+
+        with open(self.two, 'w') as f:
+            f.write('ref: two-first\npre: first\n---\nref: two-second\npre: changed\n')
+
+        self.data.refresh([self.two])
+        self.assertEqual(len(self.data._shared_values), 0)
+        self.assertIs(self.data.fetch(self.two, 'two-second').pre,
+                      self.data.fetch(self.three, 'three-first').pre)
+
+    def test_refresh_unrelated_file(self):
+        original = self.data.cache[self.three]
+
+        self.assertEqual(self.data.refresh([self.one]), set([self.one]))
+        self.assertIs(self.data.cache[self.three], original)
+
+
+class TestIndexedQueries(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.base = os.path.join(self.dir, 'example-base.yaml')
+        self.derived = os.path.join(self.dir, 'example-derived.yaml')
+
+        with open(self.base, 'w') as f:
+            f.write('ref: base\npre: base text\nedition: [manual, saas]\n---\n'
+                    'ref: other\npre: other text\nedition: saas\n---\n'
+                    'ref: _hidden\npre: hidden\n')
+        with open(self.derived, 'w') as f:
+            f.write('ref: derived\nsource:\n  file: example-base.yaml\n  ref: base\n')
+
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.c.paths = {'includes': self.dir}
+        self.data = DataCache([self.base, self.derived], self.c)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def refs(self, results):
+        return [content.ref for content in results]
+
+    def test_query_by_field(self):
+        self.assertEqual(self.refs(self.data.query(ref='other')), ['other'])
+        self.assertEqual(self.refs(self.data.query(edition='manual')), ['base', 'derived'])
+        self.assertEqual(self.refs(self.data.query(edition='saas')), ['base', 'other', 'derived'])
+
+    def test_query_combines_criteria(self):
+        self.assertEqual(self.refs(self.data.query(edition='manual', source='example-base.yaml')),
+                         ['derived'])
+        self.assertEqual(self.refs(self.data.query(edition='saas', file=self.base)),
+                         ['base', 'other'])
+        self.assertEqual(self.data.query(edition='saas', ref='missing'), [])
+
+    def test_query_without_criteria_returns_all_content(self):
+        self.assertEqual(len(self.data.query()), 3)
+
+    def test_query_unindexed_field(self):
+        with self.assertRaises(InheritableContentError):
+            self.data.query(pre='base text')
+
+    def test_refresh_updates_indexes(self):
+        with open(self.base, 'w') as f:
+            f.write('ref: base\npre: base text\nedition: manual\n')
+
+        self.data.refresh([self.base])
+        self.assertEqual(self.refs(self.data.query(edition='saas')), [])
+        self.assertEqual(self.refs(self.data.query(edition='manual')), ['base', 'derived'])
+
+    def test_lazy_cache_indexes_on_query(self):
+        data = DataCache([self.base, self.derived], self.c, lazy=True)
+        self.assertEqual(self.refs(data.query(edition='manual')), ['base', 'derived'])
+
+
+class TestContentKeyedByFields(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'example-options.yaml')
+        with open(self.fn, 'w') as f:
+            f.write('program: mongod\nname: fork\nedition: manual\npre: run {{program}}\n'
+                    'replacement:\n  program: mongod\n---\n'
+                    'program: mongos\nname: fork\npre: no tokens\n')
+
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.c.paths = {'includes': self.dir}
+        self.data = ProgramDataCache([self.fn], self.c)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_query_returns_content(self):
+        self.assertEqual([content.ref for content in self.data.query(edition='manual')],
+                         ['mongod-fork'])
+        self.assertEqual(len(self.data.query(file=self.fn)), 2)
+
+    def test_render_all_with_pool(self):
+        self.data.render_all(pool=SerialPool(), cache=ContentCache())
+
+        self.assertEqual(self.data.fetch(self.fn, ('mongod', 'fork')).pre, 'run mongod')
+        self.assertEqual(self.data.fetch(self.fn, ('mongos', 'fork')).pre, 'no tokens')
+
+
+class CountingDataCache(DataCache):
+    def __init__(self, *args, **kwargs):
+        self._loads = []
+        super(CountingDataCache, self).__init__(*args, **kwargs)
+
+    def load_documents(self, fn):
+        self._loads.append(fn)
+        return super(CountingDataCache, self).load_documents(fn)
+
+
+class TestResolutionGraph(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.c.paths = {'includes': self.dir}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        fn = os.path.join(self.dir, name)
+        with open(fn, 'w') as f:
+            f.write(content)
+
+        return fn
+
+    def test_chains_resolve_in_order(self):
+        first = self.write('graph-first.yaml',
+                           'ref: a\nsource:\n  file: graph-second.yaml\n  ref: b\n')
+        second = self.write('graph-second.yaml',
+                            'ref: b\nsource:\n  file: graph-third.yaml\n  ref: c\n')
+        third = self.write('graph-third.yaml', 'ref: c\npre: base text\n')
+
+        data = DataCache([first, second, third], self.c)
+
+        self.assertEqual(data.fetch(first, 'a').pre, 'base text')
+        self.assertEqual(data.fetch(second, 'b').pre, 'base text')
+        self.assertEqual(data.dependents(third), set([first, second]))
+
+    def test_inheritance_within_a_file(self):
+        fn = self.write('graph-local.yaml',
+                        'ref: a\nsource:\n  file: graph-local.yaml\n  ref: b\n---\n'
+                        'ref: b\npre: base text\n')
+
+        data = DataCache([fn], self.c)
+        self.assertEqual(data.fetch(fn, 'a').pre, 'base text')
+
+    def test_cycles_are_reported(self):
+        first = self.write('graph-first.yaml',
+                           'ref: a\nsource:\n  file: graph-second.yaml\n  ref: b\n')
+        second = self.write('graph-second.yaml',
+                            'ref: b\nsource:\n  file: graph-first.yaml\n  ref: a\n')
+
+        with self.assertRaises(InheritableContentError):
+            DataCache([first, second], self.c)
+
+    def test_lazy_inheritance_within_a_file(self):
+        fn = self.write('graph-local.yaml',
+                        'ref: a\nsource:\n  file: graph-local.yaml\n  ref: b\n---\n'
+                        'ref: b\npre: base text\n')
+
+        data = CountingDataCache([fn], self.c, lazy=True)
+        self.assertEqual(data.fetch(fn, 'a').pre, 'base text')
+        self.assertEqual(data._loads, [fn])
+
+    def test_lazy_cycles_are_reported(self):
+        first = self.write('graph-first.yaml',
+                           'ref: a\nsource:\n  file: graph-second.yaml\n  ref: b\n')
+        second = self.write('graph-second.yaml',
+                            'ref: b\nsource:\n  file: graph-first.yaml\n  ref: a\n')
+
+        data = DataCache([first, second], self.c, lazy=True)
+        with self.assertRaises(InheritableContentError):
+            data.fetch(first, 'a')
+
+    def test_resolution_order(self):
+        graph = {('a', 1): ('b', 1), ('b', 1): ('c', 1), ('d', 1): ('b', 1)}
+        order = DataCache.resolution_order(graph)
+
+        self.assertEqual(len(order), 3)
+        self.assertLess(order.index(('b', 1)), order.index(('a', 1)))
+        self.assertLess(order.index(('b', 1)), order.index(('d', 1)))
+
+
+class TestBulkRendering(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'example-render.yaml')
+        with open(self.fn, 'w') as f:
+            f.write('ref: first\npre: a {{one}} test\ncontent:\n  - "{{two}}"\n  - plain\n'
+                    'replacement:\n  one: "{{two}}!"\n  two: foo\n---\n'
+                    'ref: second\npre: no tokens\n')
+
+        self.c = Configuration()
+        self.c.runstate = RuntimeStateConfig()
+        self.c.paths = {'includes': self.dir}
+        self.data = DataCache([self.fn], self.c)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertRendered(self):
+        first = self.data.fetch(self.fn, 'first')
+        self.assertEqual(first.pre, 'a foo! test')
+        self.assertEqual(first.content, ['foo', 'plain'])
+        self.assertEqual(self.data.fetch(self.fn, 'second').pre, 'no tokens')
+
+    def test_render_all_in_process(self):
+        self.data.render_all()
+        self.assertRendered()
+
+    def test_render_all_with_serial_pool(self):
+        self.data.render_all(pool=SerialPool())
+        self.assertRendered()
+
+    def test_render_all_with_thread_pool(self):
+        pool = ThreadPool(2)
+        try:
+            self.data.render_all(pool=pool)
+        finally:
+            pool.close()
+
+        self.assertRendered()
+
+    def test_render_all_with_cache(self):
+        cache = ContentCache(os.path.join(self.dir, 'cache'))
+        self.data.render_all(cache=cache)
+        self.assertRendered()
+        self.assertEqual(len(cache), 1)
+
+        self.data = DataCache([self.fn], self.c)
+        self.data.render_all(pool=SerialPool(), cache=ContentCache(cache.path))
+        self.assertRendered()
+
+    def test_cached_output_is_reused(self):
+        cache = ContentCache()
+        first = self.data.fetch(self.fn, 'first')
+        fields, replacement = first.render_payload()
+        cache.set(render_key(fields, replacement), {'pre': 'cached', 'content': []})
+
+        self.data.render_all(pool=SerialPool(), cache=cache)
+        self.assertEqual(first.pre, 'cached')
+
+    def test_render_payload_only_has_fields_with_tokens(self):
+        fields, replacement = self.data.fetch(self.fn, 'first').render_payload()
+
+        self.assertEqual(set(fields), set(['pre', 'content']))
+        self.assertEqual(replacement, {'one': '{{two}}!', 'two': 'foo'})
+
+
 class TestBaseTemplateRendering(TestCase):
     def setUp(self):
         self.c = Configuration()
@@ -250,3 +712,26 @@ class TestBaseTemplateRendering(TestCase):
         self.data.render()
         self.assertFalse('{{' in self.data.pre)
         self.assertTrue('foo' in self.data.pre)
+
+    def test_nested_replacement(self):
+        self.data.replacement = {'nested': '{{state}} and {{state}}'}
+        self.data.pre = 'this is a {{nested}} test'
+        self.data.render()
+        self.assertEqual(self.data.pre, 'this is a foo and foo test')
+
+    def test_replacement_in_nested_values(self):
+        self.data.replacement = {'section': {'name': '{{state}}'}, 'state': 'foo'}
+        self.data.pre = 'this is a {{ section.name }} test'
+        self.data.render()
+        self.assertEqual(self.data.pre, 'this is a foo test')
+
+    def test_replacement_in_lists(self):
+        self.data.content = ['first {{state}}', 'second line']
+        self.data.render()
+        self.assertEqual(self.data.content, ['first foo', 'second line'])
+
+    def test_replacement_cycle(self):
+        self.data.replacement = {'state': '{{state}}'}
+        self.data.pre = 'this is a {{state}} test'
+        with self.assertRaises(InheritableContentError):
+            self.data.render()
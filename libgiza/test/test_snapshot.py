@@ -0,0 +1,102 @@
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import libgiza.config
+import libgiza.snapshot
+
+
+class SnapshotSource(libgiza.config.ConfigurationBase):
+    _option_registry = ['name', 'paths', 'editions', 'password']
+
+    @property
+    def default_name(self):
+        return '-'.join((self.name, self.editions[0]))
+
+
+class TestConfigurationSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'conf.snapshot')
+
+        self.conf = SnapshotSource({'name': 'docs', 'password': 'secret',
+                                    'paths': {'output': 'build', 'nested': {'depth': 2}},
+                                    'editions': ['manual', 'saas']})
+        self.snapshot = libgiza.snapshot.write_snapshot(self.conf, self.fn)
+
+    def tearDown(self):
+        self.snapshot.close()
+        shutil.rmtree(self.dir)
+
+    def test_values(self):
+        self.assertEqual('docs', self.snapshot.name)
+        self.assertEqual('secret', self.snapshot.password)
+        self.assertEqual(['manual', 'saas'], self.snapshot.editions)
+        self.assertEqual('build', self.snapshot.paths.output)
+        self.assertEqual(2, self.snapshot.paths.nested.depth)
+        self.assertIn('name', self.snapshot)
+        self.assertEqual(4, len(self.snapshot))
+
+    def test_values_are_decoded_on_first_access(self):
+        self.assertEqual({}, self.snapshot._values)
+
+        self.snapshot.name
+        self.assertEqual(['name'], list(self.snapshot._values))
+        self.assertIs(self.snapshot.paths, self.snapshot.paths)
+
+    def test_snapshots_are_read_only(self):
+        with self.assertRaises(TypeError):
+            self.snapshot.name = 'other'
+
+        with self.assertRaises(TypeError):
+            self.snapshot.paths.output = 'other'
+
+        with self.assertRaises(AttributeError):
+            self.snapshot.missing
+
+    def test_serialization(self):
+        self.assertEqual(self.conf.dict(), self.snapshot.dict())
+        self.assertEqual(self.conf.dict(safe=False), self.snapshot.dict(safe=False))
+
+    def test_snapshots_pickle_as_file_names(self):
+        data = pickle.dumps(self.snapshot)
+        copy = pickle.loads(data)
+
+        self.assertLess(len(data), 200)
+        self.assertEqual('docs', copy.name)
+        copy.close()
+
+    def test_computed_values_are_not_stored(self):
+        self.assertEqual('docs-manual', self.conf.default_name)
+
+        with self.assertRaises(AttributeError):
+            self.snapshot.default_name
+
+    def test_invalid_files(self):
+        with open(self.fn + '.txt', 'w') as f:
+            f.write('not a snapshot')
+
+        with self.assertRaises(libgiza.snapshot.SnapshotError):
+            libgiza.snapshot.ConfigurationSnapshot(self.fn + '.txt')
+
+    def test_empty_and_truncated_files(self):
+        with open(self.fn, 'rb') as f:
+            data = f.read()
+
+        for size in (0, 10, len(data) // 2, len(data) - 1):
+            with open(self.fn + '.part', 'wb') as f:
+                f.write(data[:size])
+
+            with self.assertRaises(libgiza.snapshot.SnapshotError):
+                libgiza.snapshot.ConfigurationSnapshot(self.fn + '.part')
+
+    def test_copies_have_their_own_mapping(self):
+        for copied in (copy.copy(self.snapshot), copy.deepcopy(self.snapshot)):
+            self.assertIsNot(self.snapshot._map, copied._map)
+            self.assertEqual('build', copied.paths.output)
+            copied.close()
+
+        self.assertEqual('docs', self.snapshot.name)
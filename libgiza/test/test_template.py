@@ -0,0 +1,116 @@
+import unittest
+
+import libgiza.template
+
+
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = libgiza.template.TemplateCache(size=2)
+
+    def test_templates_are_compiled_once(self):
+        template = self.cache.get("a {{b}} c")
+
+        self.assertIs(template, self.cache.get("a {{b}} c"))
+        self.assertEqual(1, len(self.cache))
+
+    def test_render(self):
+        self.assertEqual("a foo c", self.cache.render("a {{b}} c", {"b": "foo"}))
+
+    def test_cache_is_bounded(self):
+        for source in ("{{a}}", "{{b}}", "{{c}}"):
+            self.cache.get(source)
+
+        self.assertEqual(2, len(self.cache))
+        self.assertNotIn("{{a}}", self.cache)
+        self.assertIn("{{c}}", self.cache)
+
+    def test_least_recently_used_templates_are_evicted(self):
+        self.cache.get("{{a}}")
+        self.cache.get("{{b}}")
+        self.cache.get("{{a}}")
+        self.cache.get("{{c}}")
+
+        self.assertIn("{{a}}", self.cache)
+        self.assertNotIn("{{b}}", self.cache)
+
+    def test_templates_share_environment(self):
+        self.assertIs(self.cache.get("{{a}}").environment, self.cache.environment)
+
+    def test_clear(self):
+        self.cache.get("{{a}}")
+        self.cache.clear()
+
+        self.assertEqual(0, len(self.cache))
+
+
+class TestRenderTemplate(unittest.TestCase):
+    def test_render_uses_shared_cache(self):
+        source = "a {{b}} c -- shared cache test"
+
+        self.assertEqual("a foo c -- shared cache test",
+                         libgiza.template.render_template(source, {"b": "foo"}))
+        self.assertIn(source, libgiza.template.templates)
+
+
+class TestSimpleTemplates(unittest.TestCase):
+    def setUp(self):
+        self.cache = libgiza.template.TemplateCache()
+        self.jinja = libgiza.template.TemplateCache(fast_path=False)
+        self.replacement = {"name": "foo", "number": 42, "empty": None, "flag": True}
+
+    def assertRendersLikeJinja(self, source):
+        self.assertEqual(self.jinja.render(source, self.replacement),
+                         self.cache.render(source, self.replacement))
+
+    def test_simple_templates_use_fast_path(self):
+        for source in ("{{name}}", "a {{ name }} b {{number}}", "no tokens", "{{ name }}\n"):
+            self.assertIsInstance(self.cache.get(source), libgiza.template.SimpleTemplate)
+            self.assertRendersLikeJinja(source)
+
+    def test_complex_templates_use_jinja(self):
+        for source in ("{{ name|upper }}", "{% if flag %}yes{% endif %}", "{# note #}{{name}}",
+                       "{{ name.attr }}", "{{ true }}", "a\r\nb {{name}}", "{{- name }}"):
+            self.assertNotIsInstance(self.cache.get(source), libgiza.template.SimpleTemplate)
+            self.assertRendersLikeJinja(source)
+
+    def test_fast_path_matches_jinja_output(self):
+        for source in ("{{ missing }}", "{{empty}} {{flag}}", "a\n\n", "{{ range }}",
+                       "line one\n{{ name }}\nline three\n", "}} {{ name }} {"):
+            self.assertRendersLikeJinja(source)
+
+    def test_fast_path_can_be_disabled(self):
+        self.assertNotIsInstance(self.jinja.get("{{name}}"), libgiza.template.SimpleTemplate)
+
+
+class TestResolveReplacements(unittest.TestCase):
+    def test_values_without_tokens_are_unchanged(self):
+        replacement = {"a": "foo", "b": 42, "c": ["x"]}
+
+        self.assertEqual(replacement, libgiza.template.resolve_replacements(replacement))
+
+    def test_nested_values_are_resolved(self):
+        replacement = {"a": "{{b}} and {{c}}", "b": "{{ c }}!", "c": "foo"}
+        resolved = libgiza.template.resolve_replacements(replacement)
+
+        self.assertEqual({"a": "foo! and foo", "b": "foo!", "c": "foo"}, resolved)
+        self.assertEqual("{{b}} and {{c}}", replacement["a"])
+
+    def test_jinja_values_are_resolved(self):
+        resolved = libgiza.template.resolve_replacements({"a": "{{ b|upper }}", "b": "{{c}}",
+                                                          "c": "foo"})
+
+        self.assertEqual("FOO", resolved["a"])
+
+    def test_values_in_containers_are_resolved(self):
+        replacement = {"a": {"b": "{{c}}", "d": ["{{ c }}!", 1]}, "c": "C",
+                       "e": "{{ a.b }}"}
+        resolved = libgiza.template.resolve_replacements(replacement)
+
+        self.assertEqual({"b": "C", "d": ["C!", 1]}, resolved["a"])
+        self.assertEqual("C", resolved["e"])
+        self.assertEqual("{{c}}", replacement["a"]["b"])
+
+    def test_cycles_raise_errors(self):
+        for replacement in ({"a": "{{a}}"}, {"a": "{{b}}", "b": "{{c}}", "c": "{{a}}"}):
+            with self.assertRaises(libgiza.template.TemplateError):
+                libgiza.template.resolve_replacements(replacement)
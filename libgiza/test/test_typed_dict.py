@@ -74,6 +74,33 @@ class TestTypedDictionaryObjectCreation(unittest.TestCase):
             d.ingest(base)
             self.assertTrue(len(d) == len(base))
 
+    def test_ingest_converts_values(self):
+        d = libgiza.typed_dict.TypedDict(basestring, int)
+        d.ingest({"foo": "1", "bar": 2.0})
+
+        self.assertEqual(d, {"foo": 1, "bar": 2})
+
+    def test_ingest_with_invalid_values_raises_type_error(self):
+        d = libgiza.typed_dict.TypedDict(basestring, int)
+
+        with self.assertRaises(TypeError):
+            d.ingest({"foo": 1, "bar": "two"})
+
+    def test_update_validates_every_pair_before_adding(self):
+        d = libgiza.typed_dict.TypedDict(basestring, int)
+
+        with self.assertRaises(TypeError):
+            d.update([("foo", 1), ("bar", "two")])
+
+        self.assertEqual(len(d), 0)
+
+    def test_update_accepts_mappings_pairs_and_keywords(self):
+        d = libgiza.typed_dict.TypedDict(basestring, int)
+        d.update({"foo": 1}, bar="2")
+        d.update([("baz", 3)])
+
+        self.assertEqual(d, {"foo": 1, "bar": 2, "baz": 3})
+
 
 class Fake(object):
     def __init__(self, left, right):
@@ -174,6 +201,17 @@ class TestTypedDictionaryOperations(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.d[self.key] = self.value
 
+    def test_update_with_invalid_pair_raises_value_error(self):
+        def bad_pair_validator(key, value):
+            raise AttributeError("error")
+
+        self.d.check_pair = bad_pair_validator
+
+        with self.assertRaises(ValueError):
+            self.d.update({self.key: self.value})
+
+        self.assertEqual(len(self.d), 0)
+
     def test_setting_with_invalid_pair_raises_value_error(self):
         self.key.validate_results.add(libgiza.error.Error(message="an object has errors"))
 
@@ -13,6 +13,15 @@ import libgiza.error
 logger = logging.getLogger('libgiza.typed_dict')
 
 
+def is_default_check(check, default):
+    """
+    Returns ``True`` if the method ``check`` is the implementation
+    ``default``, which reports no errors, so that validation can skip it.
+    """
+
+    return getattr(check, '__func__', None) is getattr(default, '__func__', default)
+
+
 class TypedDict(future.utils.with_metaclass(abc.ABCMeta, dict)):
     """
     An abstract base class definition that ensures that keys and values are of
@@ -40,57 +49,109 @@ class TypedDict(future.utils.with_metaclass(abc.ABCMeta, dict)):
             raise TypeError(errors.dict())
 
     def __setitem__(self, key, value):
-        type_errors = libgiza.error.ErrorCollector()
-        value_errors = libgiza.error.ErrorCollector()
+        key, value = self._validate(key, value)
+        dict.__setitem__(self, key, value)
 
-        if isinstance(key, self.key_type):
-            value_errors.add(self.check_key(key))
-        else:
+    def update(self, *args, **kwargs):
+        """
+        Validates all new keys and values, as :meth:`__setitem__()` does,
+        and then adds all of them, or, if any fail validation, none of them.
+        """
+
+        if len(args) > 1:
+            raise TypeError('update expected at most 1 argument, got {0}'.format(len(args)))
+
+        pairs = []
+        if len(args) == 1:
+            other = args[0]
+            if hasattr(other, 'keys'):
+                pairs.extend((key, other[key]) for key in other.keys())
+            else:
+                pairs.extend(other)
+        pairs.extend(kwargs.items())
+
+        dict.update(self, [self._validate(key, value) for key, value in pairs])
+
+    def _validate(self, key, value):
+        """
+        Returns the ``(key, value)`` pair converted to the key and value types.
+        Raises :exc:`TypeError` if the key or value cannot be converted, and
+        :exc:`ValueError` if the checks report fatal errors. Only creates
+        error objects when a check fails.
+        """
+
+        type_errors = []
+        if not isinstance(key, self.key_type):
             try:
                 key = self.key_type(key)
             except Exception as e:
-                type_errors.add(libgiza.error.ErrorCollector(
+                type_errors.append(libgiza.error.Error(
                     message=("key {0} ({1}) is not of type {2} (had error "
                              "{3}:{4})").format(key, type(key), self.key_type, type(e), e)))
-
-        if isinstance(value, self.value_type):
-            value_errors.add(self.check_value(value))
+            check_key = None
         else:
+            check_key = self.check_key
+
+        if not isinstance(value, self.value_type):
             try:
                 value = self.value_type(value)
             except Exception as e:
-                type_errors.add(libgiza.error.ErrorCollector(
+                type_errors.append(libgiza.error.Error(
                     message=("value for key {0} is not of type {1} (is {2}). (had error "
                              "{3}:{4})").format(key, self.value_type, type(value), type(e), e)))
+            check_value = None
+        else:
+            check_value = self.check_value
+
+        if len(type_errors) > 0:
+            errors = libgiza.error.ErrorCollector()
+            for error in type_errors:
+                errors.add(error)
+
+            logger.debug(errors.render_output())
+            raise TypeError(errors.dict())
+
+        results = []
+        if check_key is not None and not is_default_check(check_key, TypedDict.check_key):
+            results.append(check_key(key))
+        if check_value is not None and not is_default_check(check_value, TypedDict.check_value):
+            results.append(check_value(value))
 
         # if checks for pair errors depend on type/values being correct they
         # may except in unpredictable ways
-        try:
-            value_errors.add(self.check_pair(key, value))
-        except Exception as e:
-            value_errors.add(libgiza.error.Error(
-                message=("encountered {0} error when validating "
-                         "pair for key {1}").format(type(e), key)))
-
-        if type_errors.has_errors() and type_errors.fatal:
-            logger.debug(type_errors.render_output())
-            if value_errors.has_errors():
+        if not is_default_check(self.check_pair, TypedDict.check_pair):
+            try:
+                results.append(self.check_pair(key, value))
+            except Exception as e:
+                results.append(libgiza.error.Error(
+                    message=("encountered {0} error when validating "
+                             "pair for key {1}").format(type(e), key)))
+
+        for result in results:
+            if result is None:
+                continue
+            elif isinstance(result, libgiza.error.ErrorCollector) and len(result.errors) == 0:
+                continue
+
+            # at least one check reported errors: collect all of them.
+            value_errors = libgiza.error.ErrorCollector()
+            for result in results:
+                value_errors.add(result)
+
+            if value_errors.fatal:
                 logger.debug(value_errors.render_output())
-            raise TypeError(type_errors.dict())
+                raise ValueError(value_errors.dict())
+            break
 
-        if value_errors.has_errors() and value_errors.fatal:
-            logger.debug(value_errors.render_output())
-            raise ValueError(value_errors.dict())
-
-        dict.__setitem__(self, key, value)
+        return key, value
 
     def ingest(self, args):
         if args is None or len(args) == 0:
             return
         elif isinstance(args, tuple):
-            dict.__init__(self, *args)
+            self.update(*args)
         else:
-            dict.__init__(self, args)
+            self.update(args)
 
     @abc.abstractmethod
     def check_key(self, key):